@@ -0,0 +1,113 @@
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2
+
+
+def write_text_file(path, text):
+    """先写临时文件再改名，中断时不会留下写了一半的输出"""
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_image_file(path, img):
+    """cv2.imwrite 失败时只返回 False，这里改为抛出异常，由 flush() 报告"""
+    if not cv2.imwrite(path, img):
+        raise OSError("failed to write image: {}".format(path))
+
+
+class AsyncWriter(object):
+    """
+    后台输出：txt、合并结果、带框图片、裁剪图等副作用交给独立的写出线程执行，
+    识别线程只负责提交，不等待画图、编码和磁盘。
+        max_workers: 写出线程数，0 表示在调用线程中同步执行
+        max_pending: 排队中的任务上限，超过时 submit 阻塞，限制等待写出的图片占用的内存
+    同一 key（通常是输出路径）的任务固定由同一个线程按提交顺序执行，
+    可以把同一文件的多次追加写入、以及写完之后的记录拆成多个任务提交，
+    后面的任务可以用 key_error(key) 检查之前的写入是否失败。
+    任务中的异常不会打断识别，在 flush() 时统一抛出。
+    """
+
+    def __init__(self, max_workers=2, max_pending=32):
+        self.lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-writer")
+            for _ in range(max(max_workers, 0))
+        ]
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._errors = []
+        self._key_errors = {}
+        self._round_robin = itertools.count()
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        if not self.lanes:
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self._add_error(e, key)
+            return None
+        if key is None:
+            lane = self.lanes[next(self._round_robin) % len(self.lanes)]
+        else:
+            lane = self.lanes[hash(key) % len(self.lanes)]
+        self._slots.acquire()
+        try:
+            future = lane.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(lambda f: self._task_done(f, key))
+        return future
+
+    def _add_error(self, error, key=None):
+        with self._lock:
+            self._errors.append(error)
+            if key is not None:
+                self._key_errors.setdefault(key, error)
+
+    def _task_done(self, future, key=None):
+        self._slots.release()
+        with self._lock:
+            self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            self._add_error(future.exception(), key)
+
+    def key_error(self, key):
+        """
+        该 key 已执行的任务中第一个异常，没有失败时返回 None；
+        在同一 key 的后续任务中调用时，之前提交的任务都已执行完
+        """
+        with self._lock:
+            return self._key_errors.get(key)
+
+    def write_text(self, path, text):
+        return self.submit(write_text_file, path, text, key=path)
+
+    def write_image(self, path, img):
+        return self.submit(write_image_file, path, img, key=path)
+
+    def flush(self, raise_errors=True):
+        """等待已提交的任务全部完成；有任务失败时抛出第一个异常"""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            wait(pending)
+        with self._lock:
+            errors, self._errors = self._errors, []
+            self._key_errors = {}
+        if errors and raise_errors:
+            raise errors[0]
+
+    def close(self):
+        self.flush(raise_errors=False)
+        for lane in self.lanes:
+            lane.shutdown(wait=True)
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+
+class BoxFilter(object):
+    """
+    识别前的检测框过滤：按检测得分、文字高度、长宽比过滤检测框，
+    并剔除方差/墨迹占比过低的空白裁剪图，使噪声框不进入识别模型。
+    所有阈值为 0 时表示不启用对应的过滤。
+    """
+
+    def __init__(self, args):
+        self.min_score = args.det_min_score
+        self.min_height = args.det_min_height
+        self.max_aspect_ratio = args.det_max_aspect_ratio
+        self.min_std = args.crop_min_std
+        self.min_ink = args.crop_min_ink
+        # 与背景灰度相差超过该值的像素记为墨迹
+        self.ink_delta = 32
+        # 空白检测时抽样到的最大行数
+        self.sample_rows = 32
+
+    @property
+    def check_boxes(self):
+        return self.min_score > 0 or self.min_height > 0 or self.max_aspect_ratio > 0
+
+    @property
+    def check_crops(self):
+        return self.min_std > 0 or self.min_ink > 0
+
+    def box_sides(self, box):
+        box = np.asarray(box, dtype=np.float32).reshape(-1, 2)
+        if box.shape[0] == 4:
+            width = np.linalg.norm(box[0] - box[1])
+            height = np.linalg.norm(box[0] - box[3])
+        else:
+            (_, _), (width, height), _ = cv2.minAreaRect(box)
+        return min(width, height), max(width, height)
+
+    def filter_boxes(self, dt_boxes, dt_scores):
+        """
+        return: (keep, reasons)，keep 为布尔数组，reasons 为各过滤原因的计数
+        """
+        keep = np.ones(len(dt_boxes), dtype=bool)
+        reasons = {"score": 0, "height": 0, "aspect_ratio": 0}
+        for bno, box in enumerate(dt_boxes):
+            if self.min_score > 0 and dt_scores[bno] < self.min_score:
+                keep[bno] = False
+                reasons["score"] += 1
+                continue
+            short_side, long_side = self.box_sides(box)
+            if self.min_height > 0 and short_side < self.min_height:
+                keep[bno] = False
+                reasons["height"] += 1
+                continue
+            if (
+                self.max_aspect_ratio > 0
+                and long_side / max(short_side, 1.0) > self.max_aspect_ratio
+            ):
+                keep[bno] = False
+                reasons["aspect_ratio"] += 1
+        return keep, reasons
+
+    def is_blank(self, img_crop):
+        """
+        在抽样后的灰度图上计算标准差和墨迹占比，判断裁剪图是否为空白
+        """
+        step = max(1, img_crop.shape[0] // self.sample_rows)
+        sample = img_crop[::step, ::step]
+        if sample.ndim == 3:
+            sample = sample.mean(axis=2)
+        sample = sample.astype(np.float32)
+        if self.min_std > 0 and sample.std() < self.min_std:
+            return True
+        if self.min_ink > 0:
+            ink = np.abs(sample - np.median(sample)) > self.ink_delta
+            if ink.mean() < self.min_ink:
+                return True
+        return False
@@ -0,0 +1,84 @@
+"""
+TextSystem 并发压力测试：多个线程同时对同一个模型实例调用 ocr()，
+检查每次结果都与单线程结果完全一致，并输出不同会话池大小下的吞吐
+
+    python concurrency_stress.py --image_dir ./test_images --threads 8 --pool_sizes 1,4
+
+结果不一致时以非零状态退出。
+"""
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+from onnx_paddleocr import ONNXPaddleOcr
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def list_images(image_dir):
+    files = []
+    for ext in IMAGE_EXTS:
+        files.extend(glob.glob(os.path.join(image_dir, "**", "*" + ext), recursive=True))
+    return sorted(files)
+
+
+def run_stress(model, images, expected, threads, iterations):
+    """
+    return: (不一致次数, 总调用次数, 耗时秒)
+    """
+    mismatches = []
+    barrier = threading.Barrier(threads)
+
+    def worker(tid):
+        barrier.wait()
+        for it in range(iterations):
+            # 各线程错开图片顺序，让不同图片的调用交叠
+            idx = (tid + it) % len(images)
+            result = model.ocr(images[idx])
+            if result != expected[idx]:
+                mismatches.append((tid, it, idx))
+
+    workers = [threading.Thread(target=worker, args=(tid,)) for tid in range(threads)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return len(mismatches), threads * iterations, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image_dir", type=str, required=True)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--pool_sizes", type=str, default="1,4")
+    parser.add_argument("--use_angle_cls", type=str, default="true")
+    args = parser.parse_args()
+
+    images = [img for img in (cv2.imread(f) for f in list_images(args.image_dir)) if img is not None]
+    if not images:
+        parser.error("no images found in {}".format(args.image_dir))
+
+    failed = False
+    print("{:<10}{:>10}{:>12}{:>12}".format("pool", "calls", "calls/s", "mismatch"))
+    for pool_size in [int(v) for v in args.pool_sizes.split(",") if v.strip()]:
+        model = ONNXPaddleOcr(
+            use_gpu=False,
+            use_angle_cls=args.use_angle_cls.lower() in ("true", "t", "1"),
+            session_pool_size=pool_size,
+        )
+        expected = [model.ocr(img) for img in images]
+        mismatch, calls, elapsed = run_stress(model, images, expected, args.threads, args.iterations)
+        failed = failed or mismatch > 0
+        print("{:<10}{:>10}{:>12.2f}{:>12}".format(pool_size, calls, calls / elapsed, mismatch))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import cv2
+
+
+class CpuBudget(object):
+    """
+    进程的 CPU 预算：把 cores 个核分给 workers 个并发调用。
+    同一调用内 det/cls/rec 和 OpenCV 预处理是先后执行的，所以每个调用分到的核数
+    同时作为 onnxruntime intra-op 线程数和 OpenCV 线程数；并发调用数超过核数时截断。
+        cores: 可用核数，0 表示全部核
+        workers: 并发调用数（线程池大小或会话池大小）
+    """
+
+    def __init__(self, cores=0, workers=1):
+        self.cores = cores if cores > 0 else (os.cpu_count() or 1)
+        self.workers = max(1, min(workers, self.cores))
+        self.threads_per_worker = max(1, self.cores // self.workers)
+
+    @property
+    def ort_threads(self):
+        return self.threads_per_worker
+
+    @property
+    def cv2_threads(self):
+        # OpenCV 的线程数是进程级的，多个调用同时做预处理时按调用数均分
+        return self.threads_per_worker
+
+    def describe(self):
+        return (
+            "[cpu budget] {} cores: {} concurrent calls x {} ORT intra-op threads "
+            "(spin-wait off, inter-op 1), OpenCV {} threads".format(
+                self.cores, self.workers, self.ort_threads, self.cv2_threads
+            )
+        )
+
+    def apply(self, args, report=True):
+        """
+        按预算设置 OpenCV 线程数，并改写 args 中的 onnxruntime 线程参数；
+        已显式指定的 intra_op_num_threads 保留
+        """
+        cv2.setNumThreads(self.cv2_threads)
+        if args.intra_op_num_threads <= 0:
+            args.intra_op_num_threads = self.ort_threads
+        # det/cls/rec 各有自己的线程池但不会同时运行，关闭空闲时的自旋等待，
+        # 避免不在运行的阶段的线程池占用 CPU
+        args.ort_allow_spinning = False
+        if report:
+            print(self.describe(), file=sys.stderr)
+        return self
+
+
+def apply_cpu_budget(args):
+    """
+    args.cpu_budget > 0（核数）或 -1（全部核）时启用预算，并发数取 cpu_workers，
+    未指定时取 session_pool_size；cpu_budget 为 0 时不做任何设置，返回 None
+    """
+    if not args.cpu_budget:
+        return None
+    workers = args.cpu_workers if args.cpu_workers > 0 else args.session_pool_size
+    return CpuBudget(max(args.cpu_budget, 0), workers).apply(args)
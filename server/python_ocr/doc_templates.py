@@ -0,0 +1,305 @@
+import glob
+import json
+import os
+
+import cv2
+import numpy as np
+
+from reading_order import layout_to_text
+from utils import get_rotate_crop_image, module_dir
+
+# 随代码发布的证件模板（PAN 卡、Aadhaar 卡正面）
+DEFAULT_TEMPLATE_DIR = str(module_dir / "templates")
+
+
+class DocTemplate(object):
+    """
+    证件模板：证件的归一化版面（坐标范围 [0, 1]，相对证件四边）。
+        aspect_ratio: 证件宽高比
+        fields: {字段名: {"box": [x0, y0, x1, y1], "single_line": bool}}
+        anchors: 每张证件都有的固定印刷文字（标题、字段标签）的位置，用于匹配和对齐；
+            没有锚点的模板只按证件外轮廓的宽高比匹配
+        masks: 识别时需要遮挡的区域（照片、固定文字等）
+    """
+
+    def __init__(self, name, aspect_ratio, fields, anchors=None, masks=None, min_score=0.5):
+        self.name = name
+        self.aspect_ratio = float(aspect_ratio)
+        self.fields = fields
+        self.anchors = np.array(anchors or [], dtype=np.float32).reshape(-1, 4)
+        self.masks = np.array(masks or [], dtype=np.float32).reshape(-1, 4)
+        self.min_score = min_score
+        # 模板画布尺寸，归一化坐标乘以该尺寸得到像素坐标
+        self.canvas_w = 1000.0
+        self.canvas_h = 1000.0 / self.aspect_ratio
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["name"],
+            d["aspect_ratio"],
+            d["fields"],
+            anchors=d.get("anchors"),
+            masks=d.get("masks"),
+            min_score=d.get("min_score", 0.5),
+        )
+
+    def to_canvas(self, boxes):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        return boxes * np.array(
+            [self.canvas_w, self.canvas_h, self.canvas_w, self.canvas_h], dtype=np.float32
+        )
+
+    def canvas_corners(self):
+        w, h = self.canvas_w, self.canvas_h
+        return np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
+
+
+def rect_to_quad(rect):
+    x0, y0, x1, y1 = rect
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float32)
+
+
+def order_quad(pts):
+    pts = np.asarray(pts, dtype=np.float32).reshape(4, 2)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).reshape(-1)
+    return np.array(
+        [pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]],
+        dtype=np.float32,
+    )
+
+
+def find_document_quad(img, min_area_ratio=0.3):
+    """
+    在缩小的图上找证件外轮廓（最大的四边形），找不到时返回整张图的四角
+    """
+    quad = detect_document_quad(img, min_area_ratio)
+    return image_corners(img.shape) if quad is None else quad
+
+
+def image_corners(img_shape):
+    h, w = img_shape[0:2]
+    return np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype=np.float32)
+
+
+def detect_document_quad(img, min_area_ratio=0.3):
+    """证件外轮廓四边形（顺时针，从左上角开始），找不到时返回 None"""
+    h, w = img.shape[0:2]
+    scale = min(1.0, 512.0 / max(h, w))
+    small = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))))
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    best, best_area = None, min_area_ratio * small.shape[0] * small.shape[1]
+    for contour in contours:
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        area = cv2.contourArea(approx)
+        if len(approx) == 4 and area > best_area:
+            best, best_area = approx, area
+    if best is None:
+        return None
+    return order_quad(best.reshape(4, 2) / scale)
+
+
+class TemplateOCR(object):
+    """
+    模板驱动的区域识别：先用低分辨率检测结果把图片与已登记的模板匹配并对齐
+    （证件外轮廓得到初始单应矩阵，再用模板锚点与检测框的对应关系 RANSAC 精修），
+    然后只在字段区域内裁剪、遮挡固定文字并识别，单行字段合并成一个识别批次。
+    匹配不上任何模板时返回 None，调用方可回退到整页识别。
+    """
+
+    def __init__(self, text_system, align_side_len=640):
+        self.text_system = text_system
+        self.align_side_len = align_side_len
+        self.templates = {}
+        # 无锚点模板：证件外轮廓宽高比与模板相差该比例时得分降为 0
+        self.aspect_tol = 0.25
+
+    def register(self, template):
+        if isinstance(template, dict):
+            template = DocTemplate.from_dict(template)
+        self.templates[template.name] = template
+        return template
+
+    def load(self, path):
+        """从 JSON 文件或目录中的所有 JSON 文件登记模板"""
+        files = sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file, "r", encoding="utf-8") as f:
+                self.register(json.load(f))
+        return list(self.templates)
+
+    def score_aspect(self, template, doc_quad):
+        """无锚点模板的匹配得分：证件外轮廓的宽高比与模板越接近得分越高"""
+        if doc_quad is None:
+            return 0.0
+        width = (np.linalg.norm(doc_quad[1] - doc_quad[0]) + np.linalg.norm(doc_quad[2] - doc_quad[3])) / 2
+        height = (np.linalg.norm(doc_quad[3] - doc_quad[0]) + np.linalg.norm(doc_quad[2] - doc_quad[1])) / 2
+        if width <= 0 or height <= 0:
+            return 0.0
+        diff = abs(np.log(width / height / template.aspect_ratio))
+        return float(max(0.0, 1.0 - diff / np.log(1.0 + self.aspect_tol)))
+
+    def score_alignment(self, template, H, box_centers, box_rects):
+        """
+        锚点投影到图像后，中心落在某个高度相近（相差不超过 2 倍）的检测框内的比例；
+        同时返回匹配到的检测框下标。限制高度避免多行合并成的大框吸收所有锚点
+        """
+        if len(template.anchors) == 0 or len(box_centers) == 0:
+            return 0.0, []
+        anchors = template.to_canvas(template.anchors)
+        centers = np.stack(
+            [(anchors[:, 0] + anchors[:, 2]) / 2, (anchors[:, 1] + anchors[:, 3]) / 2], axis=1
+        )
+        projected = cv2.perspectiveTransform(centers.reshape(-1, 1, 2), H).reshape(-1, 2)
+        # 锚点上下边中点投影后的距离作为锚点在图像中的高度
+        edges = np.concatenate([np.stack([centers[:, 0], anchors[:, 1]], 1), np.stack([centers[:, 0], anchors[:, 3]], 1)])
+        edges = cv2.perspectiveTransform(edges.reshape(-1, 1, 2), H).reshape(2, -1, 2)
+        anchor_h = np.maximum(np.linalg.norm(edges[1] - edges[0], axis=1), 1.0)
+        box_h = np.maximum(box_rects[:, 3] - box_rects[:, 1], 1.0)
+        matches = []
+        for pno, (x, y) in enumerate(projected):
+            inside = (
+                (box_rects[:, 0] <= x) & (x <= box_rects[:, 2])
+                & (box_rects[:, 1] <= y) & (y <= box_rects[:, 3])
+                & (box_h <= 2 * anchor_h[pno]) & (box_h * 2 >= anchor_h[pno])
+            )
+            if np.any(inside):
+                dist = np.linalg.norm(box_centers - (x, y), axis=1)
+                dist[~inside] = np.inf
+                matches.append((pno, int(np.argmin(dist))))
+        return len(matches) / float(len(anchors)), matches
+
+    def refine(self, template, H, matches, box_centers):
+        if len(matches) < 4:
+            return H
+        anchors = template.to_canvas(template.anchors)
+        src = np.array(
+            [((anchors[a, 0] + anchors[a, 2]) / 2, (anchors[a, 1] + anchors[a, 3]) / 2) for a, _ in matches],
+            dtype=np.float32,
+        )
+        dst = np.array([box_centers[b] for _, b in matches], dtype=np.float32)
+        H_refined, _ = cv2.findHomography(src, dst, cv2.RANSAC, 10.0)
+        if H_refined is None or not self.is_plausible(template, H, H_refined):
+            return H
+        return H_refined
+
+    @staticmethod
+    def is_plausible(template, H, H_refined, max_area_change=0.5):
+        """精修后的证件四角须仍为凸四边形，且面积与初始对齐相差不大，避免锚点误匹配导致的退化变换"""
+        corners = template.canvas_corners().reshape(-1, 1, 2)
+        quad = cv2.perspectiveTransform(corners, H)
+        refined = cv2.perspectiveTransform(corners, H_refined)
+        if not cv2.isContourConvex(refined.astype(np.float32)):
+            return False
+        area = cv2.contourArea(quad)
+        refined_area = cv2.contourArea(refined)
+        return area > 0 and abs(refined_area - area) <= max_area_change * area
+
+    def align(self, img, template_name=None):
+        """
+        return: (template, H, score)，H 把模板画布坐标映射到图像坐标；
+            匹配失败时 template 为 None
+        """
+        names = [template_name] if template_name else list(self.templates)
+        detected_quad = detect_document_quad(img)
+        doc_quad = image_corners(img.shape) if detected_quad is None else detected_quad
+        box_centers = box_rects = np.zeros((0, 4), dtype=np.float32)
+        if any(len(self.templates[name].anchors) for name in names):
+            dt_boxes = self.text_system.text_detector(img, limit_side_len=self.align_side_len)
+            if dt_boxes is not None and len(dt_boxes) > 0:
+                dt_boxes = np.asarray(dt_boxes, dtype=np.float32).reshape(-1, 4, 2)
+                box_rects = np.concatenate([dt_boxes.min(axis=1), dt_boxes.max(axis=1)], axis=1)
+                box_centers = dt_boxes.mean(axis=1)
+
+        best = (None, None, 0.0)
+        for name in names:
+            template = self.templates[name]
+            H = cv2.getPerspectiveTransform(template.canvas_corners(), doc_quad)
+            if len(template.anchors) == 0:
+                score = self.score_aspect(template, detected_quad)
+                if score >= template.min_score and score > best[2]:
+                    best = (template, H, score)
+                continue
+            score, matches = self.score_alignment(template, H, box_centers, box_rects)
+            H_refined = self.refine(template, H, matches, box_centers)
+            refined_score, _ = self.score_alignment(template, H_refined, box_centers, box_rects)
+            if refined_score >= score:
+                H, score = H_refined, refined_score
+            if score >= template.min_score and score > best[2]:
+                best = (template, H, score)
+        return best
+
+    def crop_field(self, img, template, H, rect, pad=0.01):
+        """按字段区域裁剪并摆正，区域内与遮挡区域重叠的部分填充为背景色"""
+        x0, y0, x1, y1 = rect
+        rect = np.clip([x0 - pad, y0 - pad, x1 + pad, y1 + pad], 0, 1)
+        canvas_rect = template.to_canvas(rect)[0]
+        quad = cv2.perspectiveTransform(rect_to_quad(canvas_rect).reshape(-1, 1, 2), H)
+        crop = get_rotate_crop_image(img, quad.reshape(4, 2).astype(np.float32))
+        if len(template.masks) == 0:
+            return crop
+        rect_w = float(canvas_rect[2] - canvas_rect[0])
+        rect_h = float(canvas_rect[3] - canvas_rect[1])
+        if rect_h / rect_w >= 1.5:
+            # 竖长区域已被 get_rotate_crop_image 旋转，不做遮挡
+            return crop
+        crop_h, crop_w = crop.shape[0:2]
+        # 彩色图按通道取中位数，灰度图取一个标量
+        if crop.ndim == 3:
+            fill = np.median(crop.reshape(-1, crop.shape[2]), axis=0)
+        else:
+            fill = np.median(crop)
+        sx = crop_w / rect_w
+        sy = crop_h / rect_h
+        for mx0, my0, mx1, my1 in template.to_canvas(template.masks):
+            ix0 = int(max(mx0 - canvas_rect[0], 0) * sx)
+            iy0 = int(max(my0 - canvas_rect[1], 0) * sy)
+            ix1 = int(min(mx1 - canvas_rect[0], rect_w) * sx)
+            iy1 = int(min(my1 - canvas_rect[1], rect_h) * sy)
+            if ix1 > ix0 and iy1 > iy0:
+                crop[iy0:iy1, ix0:ix1] = fill
+        return crop
+
+    def __call__(self, img, template_name=None, stats=None):
+        """
+        return: None（未匹配到模板）或
+            {"template": 模板名, "score": 匹配得分,
+             "fields": {字段名: {"text": ..., "confidence": ..., "box": 图像坐标四边形}}}
+        """
+        template, H, score = self.align(img, template_name)
+        if stats is not None:
+            stats["template"] = template.name if template else None
+            stats["template_score"] = score
+        if template is None:
+            return None
+
+        fields = {}
+        single_names, single_crops = [], []
+        for name, field in template.fields.items():
+            rect = field["box"]
+            canvas_rect = template.to_canvas(rect)[0]
+            quad = cv2.perspectiveTransform(rect_to_quad(canvas_rect).reshape(-1, 1, 2), H)
+            fields[name] = {"text": "", "confidence": 0.0, "box": quad.reshape(4, 2).tolist()}
+            crop = self.crop_field(img, template, H, rect)
+            if field.get("single_line", True):
+                single_names.append(name)
+                single_crops.append(crop)
+            else:
+                # 多行字段：只在字段区域内做检测和识别
+                field_stats = {}
+                dt_boxes, rec_res = self.text_system(crop, stats=field_stats)
+                if rec_res:
+                    texts = [res[0] for res in rec_res]
+                    fields[name]["text"] = layout_to_text(texts, field_stats["layout"])
+                    fields[name]["confidence"] = float(np.mean([res[1] for res in rec_res]))
+
+        if single_crops:
+            rec_res = self.text_system.text_recognizer(single_crops)
+            for name, res in zip(single_names, rec_res):
+                fields[name]["text"] = res[0]
+                fields[name]["confidence"] = float(res[1])
+        return {"template": template.name, "score": score, "fields": fields}
@@ -0,0 +1,89 @@
+"""
+对比 OCRLogic 的线程池与进程池后端：对同一目录下的图片和PDF批量识别，输出耗时和吞吐
+
+    python executor_benchmark.py --input_dir ./test_files --workers 4 --repeat 2
+
+进程池首次运行包含工作进程启动和模型加载时间，单独列为 startup，
+之后的重复运行复用同一进程池。
+"""
+import argparse
+import glob
+import os
+import time
+
+from ocr_images_pdfs import OCRLogic, pdf_page_count
+
+INPUT_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".pdf")
+
+
+def list_inputs(input_dir):
+    files = []
+    for ext in INPUT_EXTS:
+        files.extend(glob.glob(os.path.join(input_dir, "**", "*" + ext), recursive=True))
+    # 排除之前运行输出的带框图片
+    return sorted(f for f in files if "Output_OCR" not in f)
+
+
+def count_pages(files):
+    pages = 0
+    for file in files:
+        if file.lower().endswith(".pdf"):
+            pages += pdf_page_count(file) if pdf_page_count else 0
+        else:
+            pages += 1
+    return pages
+
+
+def run_backend(logic, files, backend, workers, repeat, model_name):
+    run = lambda: logic.run(
+        files, save_txt=False, merge_txt=False, max_workers=workers, model_name=model_name, backend=backend
+    )
+    # 首次运行：进程池后端包含启动和模型加载
+    start = time.time()
+    run()
+    startup = time.time() - start
+    elapsed = []
+    for _ in range(repeat):
+        start = time.time()
+        run()
+        elapsed.append(time.time() - start)
+    return startup, min(elapsed), sum(elapsed) / len(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_dir", type=str, required=True)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--model_name", type=str, default="PP-OCRv5")
+    parser.add_argument("--backends", type=str, default="thread,process")
+    args = parser.parse_args()
+
+    files = list_inputs(args.input_dir)
+    if not files:
+        parser.error("no images or PDFs found in {}".format(args.input_dir))
+    pages = count_pages(files)
+    print("{} files, {} pages, {} workers".format(len(files), pages, args.workers))
+
+    logic = OCRLogic(lambda msg: None, model_name=args.model_name)
+    rows = []
+    try:
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            startup, best, mean = run_backend(
+                logic, files, backend, args.workers, max(args.repeat, 1), args.model_name
+            )
+            rows.append((backend, startup, best, mean))
+    finally:
+        logic.close()
+
+    print("{:<10}{:>12}{:>10}{:>10}{:>12}".format("backend", "startup s", "best s", "mean s", "pages/s"))
+    for backend, startup, best, mean in rows:
+        print(
+            "{:<10}{:>12.2f}{:>10.2f}{:>10.2f}{:>12.2f}".format(
+                backend, startup, best, mean, pages / max(best, 1e-6)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# 解码缩小倍数 -> OpenCV 标志；JPEG 在 DCT 域直接按 1/2、1/4、1/8 解码，
+# 其他格式先完整解码再缩小（只节省后续处理的内存）
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def image_size(data):
+    """只读文件头取得图片尺寸 (宽, 高)，未按 EXIF 方向旋转；无法识别时返回 None"""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return im.size
+    except Exception:
+        return None
+
+
+def choose_reduction(size, min_side, limit_type="max"):
+    """
+    解码缩小倍数：缩小后用于检测限制的边（limit_type 为 "max" 时取长边，否则取短边）
+    仍不小于 min_side 的最大 2 的幂（不超过 8）
+    """
+    if not size or min_side <= 0:
+        return 1
+    side = max(size) if limit_type == "max" else min(size)
+    factor = 1
+    while factor < 8 and side / (factor * 2) >= min_side:
+        factor *= 2
+    return factor
+
+
+def decode_image(data, min_side=0, limit_type="max"):
+    """
+    解码图片字节，尺寸远超检测需要时按 2 的幂缩小解码
+    min_side: 缩小后检测限制边的最小像素数，通常为 det_limit_side_len 乘以裁剪余量；0 表示不缩小
+    return: (图片, (x缩放, y缩放))，图片坐标乘以缩放得到原图坐标；解码失败时图片为 None
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    size = image_size(data)
+    factor = choose_reduction(size, min_side, limit_type)
+    img = cv2.imdecode(buf, REDUCED_FLAGS[factor])
+    if img is None or factor == 1:
+        return img, (1.0, 1.0)
+    w, h = size
+    # 解码时已按 EXIF 方向旋转，宽高可能互换
+    if (w >= h) != (img.shape[1] >= img.shape[0]):
+        w, h = h, w
+    return img, (w / float(img.shape[1]), h / float(img.shape[0]))
+
+
+def read_image_file(path, min_side=0, limit_type="max"):
+    """读取图片文件（兼容中文路径），参数和返回值同 decode_image；文件无法读取时图片为 None"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None, (1.0, 1.0)
+    return decode_image(data, min_side, limit_type)
+
+
+def scale_result(result, scale):
+    """把 ocr() 结果中的框坐标按 (x缩放, y缩放) 换算回原图坐标"""
+    sx, sy = scale
+    if sx == 1.0 and sy == 1.0:
+        return result
+    return [
+        [[[[x * sx, y * sy] for x, y in box], res] for box, res in page] if page else page
+        for page in result
+    ]
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# 不影响识别结果的参数，不计入配置哈希
+RUNTIME_ONLY_KEYS = (
+    "cpu_budget",
+    "cpu_workers",
+    "session_pool_size",
+    "intra_op_num_threads",
+    "ort_allow_spinning",
+    "shared_weights",
+    "shared_weights_prepack",
+)
+
+
+def config_hash(config):
+    """识别配置的哈希：配置相同的结果才能复用"""
+    config = {k: v for k, v in config.items() if k not in RUNTIME_ONLY_KEYS}
+    data = json.dumps(config, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class JobManifest(object):
+    """
+    批量识别的任务清单，JSON Lines 格式，只追加写入。每行记录一个输入文件：
+        path, size, mtime_ns, content_hash, config_hash, status ("done"/"failed"), output, error, time
+    重新运行时，内容哈希和配置哈希都相同、状态为 done 且输出文件仍存在的输入直接跳过，
+    失败或中断的输入重新识别；同一输入以最后一条记录为准。内容相同、路径不同的文件不重新识别，
+    由调用方把已有结果复制到该文件自己的输出位置并追加一条记录。
+    路径、大小和修改时间都没变的文件复用记录中的内容哈希，不再重新读取。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = {}
+        self._hash_cache = {}
+        self._load()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时可能留下写了一半的最后一行
+                    continue
+                self._remember(record)
+
+    def _remember(self, record):
+        self._records[(record["content_hash"], record["config_hash"])] = record
+        self._hash_cache[(record["path"], record["size"], record["mtime_ns"])] = record["content_hash"]
+
+    def content_hash(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._hash_cache.get(key)
+        if cached is not None:
+            return cached
+        digest = file_hash(path)
+        with self._lock:
+            self._hash_cache[key] = digest
+        return digest
+
+    def completed(self, content_hash, cfg_hash):
+        """已成功且输出仍存在时返回该记录，否则返回 None"""
+        with self._lock:
+            record = self._records.get((content_hash, cfg_hash))
+        if record is None or record["status"] != "done":
+            return None
+        if record.get("output") and not os.path.exists(record["output"]):
+            return None
+        return record
+
+    def record(self, path, content_hash, cfg_hash, status, output=None, error=None):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        record = {
+            "path": path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "content_hash": content_hash,
+            "config_hash": cfg_hash,
+            "status": status,
+            "output": output,
+            "error": error,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._remember(record)
+        return record
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
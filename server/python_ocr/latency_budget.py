@@ -0,0 +1,86 @@
+import threading
+import time
+
+
+class StageCostModel(object):
+    """
+    各阶段耗时估计，按最近请求的实测值做指数滑动平均：
+        det: 每百万像素（检测模型输入）的毫秒数
+        cls: 每个文本行的毫秒数
+        rec: 每个文本行的毫秒数（不含两级识别的第二级）
+        rec_cascade: 两级识别时第二级平均到每个文本行的毫秒数（含未送入第二级的行）
+        crop: 每个透视变换裁剪的毫秒数（用于估计整页倾斜校正节省的时间）
+    未有实测数据前使用保守的先验值
+    """
+
+    def __init__(self, alpha=0.2, priors=None):
+        self.alpha = alpha
+        self.costs = dict(priors or {"det": 150.0, "cls": 2.0, "rec": 10.0, "rec_cascade": 5.0, "crop": 0.3})
+        self.lock = threading.Lock()
+
+    def update(self, stage, elapsed_ms, amount):
+        if amount <= 0:
+            return
+        unit_cost = elapsed_ms / amount
+        with self.lock:
+            self.costs[stage] = (1 - self.alpha) * self.costs[stage] + self.alpha * unit_cost
+
+    def estimate(self, stage, amount):
+        with self.lock:
+            return self.costs[stage] * amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.costs)
+
+
+def det_input_mpix(img_shape, limit_side_len, limit_type="max"):
+    """估计 DetResizeForTest 之后检测模型输入的像素数（百万）"""
+    h, w = img_shape[0:2]
+    if limit_type == "max":
+        ratio = min(1.0, float(limit_side_len) / max(h, w))
+    elif limit_type == "min":
+        ratio = max(1.0, float(limit_side_len) / min(h, w))
+    else:
+        ratio = float(limit_side_len) / max(h, w)
+    return h * w * ratio * ratio / 1e6
+
+
+class LatencyBudget(object):
+    """
+    单次请求的时间预算：根据耗时估计选择更便宜的处理方式，
+    并在各阶段之间检查剩余时间
+    """
+
+    # 检测阶段最多使用预算的比例，其余留给方向分类和识别
+    det_share = 0.4
+
+    def __init__(self, deadline_ms, cost_model, start=None):
+        self.deadline_ms = deadline_ms
+        self.cost_model = cost_model
+        self.start = time.time() if start is None else start
+        self.degraded = []
+
+    def elapsed_ms(self):
+        return (time.time() - self.start) * 1000
+
+    def remaining_ms(self):
+        return self.deadline_ms - self.elapsed_ms()
+
+    def can_afford(self, stage, amount, reserve_ms=0.0):
+        return self.cost_model.estimate(stage, amount) + reserve_ms <= self.remaining_ms()
+
+    def choose_det_side(self, img_shape, limit_side_len, limit_type="max"):
+        """
+        在不超过默认值的候选边长中，选最大的、预计耗时在检测预算内的一个
+        """
+        candidates = [limit_side_len] + [
+            side for side in (736, 640, 512, 384) if side < limit_side_len
+        ]
+        det_budget = self.remaining_ms() * self.det_share
+        for side in candidates:
+            if self.cost_model.estimate("det", det_input_mpix(img_shape, side, limit_type)) <= det_budget:
+                break
+        if side != limit_side_len:
+            self.degraded.append("det_side_{}".format(side))
+        return side
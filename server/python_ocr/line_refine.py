@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+
+from utils import get_rotate_crop_image, get_minarea_rect_crop
+
+
+class LineRefiner(object):
+    """
+    低置信度文本行的二次识别：按检测框重新裁剪，四周留出余量，避免检测框偏紧切掉笔画；
+    输入图是缩小解码的图片时，调用方把框换算到高分辨率原图上再裁剪（见 TextSystem.refine_low_confidence），
+    否则与第一次识别用的是同一张图。过小的行用双三次插值放大到识别输入高度，
+    可选按灰度分位数拉伸对比度。调用方把这些裁剪图作为一个额外批次识别，
+    保留两次中置信度更高的结果。
+        thresh: 置信度低于该值的行参与二次识别
+        pad: 余量，占文字行高度的比例
+        max_lines: 每页最多二次识别的行数（取置信度最低的），0 表示不限
+    """
+
+    def __init__(self, args, rec_height=48):
+        self.thresh = args.refine_thresh
+        self.pad = args.refine_pad
+        self.contrast = args.refine_contrast
+        self.max_lines = args.refine_max_lines
+        self.box_type = args.det_box_type
+        self.rec_height = rec_height
+
+    def select(self, rec_res):
+        """需要二次识别的行下标，置信度从低到高"""
+        doubtful = sorted(
+            (i for i, res in enumerate(rec_res) if res[1] < self.thresh),
+            key=lambda i: rec_res[i][1],
+        )
+        if self.max_lines > 0:
+            doubtful = doubtful[: self.max_lines]
+        return doubtful
+
+    def pad_box(self, box, img_shape):
+        """沿文字行方向和高度方向各向外扩 pad 倍行高，四个点的顺序不变"""
+        box = np.asarray(box, dtype=np.float32).reshape(4, 2)
+        u = box[1] - box[0]
+        v = box[3] - box[0]
+        width = max(np.linalg.norm(u), 1.0)
+        height = max(np.linalg.norm(v), 1.0)
+        pad = self.pad * min(width, height)
+        du = u / width * pad
+        dv = v / height * pad
+        padded = box + np.float32([-du - dv, du - dv, du + dv, -du + dv])
+        padded[:, 0] = np.clip(padded[:, 0], 0, img_shape[1] - 1)
+        padded[:, 1] = np.clip(padded[:, 1], 0, img_shape[0] - 1)
+        return padded
+
+    def crop(self, img, box):
+        if self.box_type == "quad":
+            img_crop = get_rotate_crop_image(img, self.pad_box(box, img.shape))
+        else:
+            (cx, cy), (w, h), angle = cv2.minAreaRect(np.asarray(box, dtype=np.float32).reshape(-1, 2))
+            pad = 2 * self.pad * min(w, h)
+            img_crop = get_minarea_rect_crop(img, cv2.boxPoints(((cx, cy), (w + pad, h + pad), angle)))
+        h, w = img_crop.shape[:2]
+        if 0 < h < self.rec_height:
+            scale = self.rec_height / float(h)
+            img_crop = cv2.resize(
+                img_crop, (max(int(round(w * scale)), 1), self.rec_height), interpolation=cv2.INTER_CUBIC
+            )
+        if self.contrast:
+            img_crop = self.stretch(img_crop)
+        return img_crop
+
+    @staticmethod
+    def stretch(img):
+        """按灰度 1%、99% 分位数线性拉伸到 0~255，对比度已足够或接近纯色时不变"""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256)) / float(max(gray.size, 1))
+        lo, hi = np.searchsorted(cdf, (0.01, 0.99))
+        if hi - lo < 8 or (lo <= 8 and hi >= 247):
+            return img
+        lut = np.clip((np.arange(256) - lo) * 255.0 / (hi - lo), 0, 255).astype(np.uint8)
+        return cv2.LUT(np.ascontiguousarray(img), lut)
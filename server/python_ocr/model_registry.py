@@ -0,0 +1,167 @@
+import os
+import threading
+from collections import OrderedDict
+
+from onnx_paddleocr import ONNXPaddleOcr
+from utils import infer_args, module_dir, quantized_model_path, shared_model_path
+
+
+class ModelRegistry(object):
+    """
+    多模型注册表：按名称登记模型版本（PP-OCRv5/v4、mobile/server、量化等），
+    首次使用时才创建 ONNXPaddleOcr，已加载的模型按 LRU 保留，
+    超过数量上限或内存上限时淘汰最久未用的模型。
+
+    替换或淘汰模型只是从注册表中移除引用：已经拿到旧模型的请求会在旧模型上
+    正常完成，旧模型在最后一个请求结束后由垃圾回收释放。
+    """
+
+    def __init__(self, max_models=2, max_memory_mb=0):
+        self.max_models = max_models
+        # 0 表示不限制；内存按模型文件大小估算
+        self.max_memory_mb = max_memory_mb
+        self._configs = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def register(self, name, **kwargs):
+        """登记一个模型版本，kwargs 为 ONNXPaddleOcr 的参数；已加载的同名模型会被卸载"""
+        with self._lock:
+            self._configs[name] = kwargs
+            self._loaded.pop(name, None)
+
+    def config(self, name):
+        with self._lock:
+            return dict(self._configs[name])
+
+    def names(self):
+        with self._lock:
+            return list(self._configs)
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def estimate_memory_mb(self, name):
+        kwargs = self._configs[name]
+        size = 0
+        for stage in ("det", "cls", "rec", "rec_cascade"):
+            if stage == "cls" and not kwargs.get("use_angle_cls", False):
+                continue
+            model_dir = kwargs.get(stage + "_model_dir")
+            if model_dir is None:
+                continue
+            model_dir = quantized_model_path(model_dir, kwargs.get(stage + "_quant"))
+            if kwargs.get("shared_weights"):
+                # 共享权重在多个进程间只占一份，仍按映射大小估计
+                model_dir = shared_model_path(model_dir)
+                weights = os.path.splitext(model_dir)[0] + ".weights"
+                if os.path.exists(weights):
+                    size += os.path.getsize(weights)
+            if os.path.exists(model_dir):
+                size += os.path.getsize(model_dir)
+        return size / 1e6
+
+    def get(self, name):
+        """取得模型，未加载时加载；同一模型并发加载时只创建一次"""
+        with self._lock:
+            if name not in self._configs:
+                raise KeyError("unknown OCR model: {}".format(name))
+            model = self._loaded.get(name)
+            if model is not None:
+                self._loaded.move_to_end(name)
+                return model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                model = self._loaded.get(name)
+                if model is not None:
+                    self._loaded.move_to_end(name)
+                    return model
+                kwargs = dict(self._configs[name])
+            # 在注册表锁之外创建模型，不阻塞其他模型的请求
+            model = ONNXPaddleOcr(**kwargs)
+            with self._lock:
+                if self._configs.get(name) == kwargs:
+                    self._loaded[name] = model
+                    self._evict(keep=name)
+        return model
+
+    def swap(self, name, **kwargs):
+        """
+        热替换：先创建新模型（不持有锁），成功后再原子地替换注册表中的条目，
+        创建失败时旧模型保持不变
+        """
+        model = ONNXPaddleOcr(**kwargs)
+        with self._lock:
+            self._configs[name] = kwargs
+            self._loaded[name] = model
+            self._loaded.move_to_end(name)
+            self._evict(keep=name)
+        return model
+
+    def evict(self, name):
+        with self._lock:
+            self._loaded.pop(name, None)
+
+    def _evict(self, keep):
+        """淘汰最久未用的模型，调用时需持有 self._lock"""
+
+        def over_limit():
+            if self.max_models > 0 and len(self._loaded) > self.max_models:
+                return True
+            if self.max_memory_mb > 0:
+                total = sum(self.estimate_memory_mb(n) for n in self._loaded)
+                return total > self.max_memory_mb
+            return False
+
+        while len(self._loaded) > 1 and over_limit():
+            oldest = next(iter(self._loaded))
+            if oldest == keep:
+                self._loaded.move_to_end(oldest)
+                oldest = next(iter(self._loaded))
+            self._loaded.pop(oldest)
+
+    def ocr(self, img, model_name, **kwargs):
+        """使用指定模型识别，kwargs 透传给 ONNXPaddleOcr.ocr"""
+        return self.get(model_name).ocr(img, **kwargs)
+
+
+def register_default_models(registry, base_model_dir=None, use_gpu=False, use_angle_cls=True, **model_kwargs):
+    """
+    登记内置模型版本，所有模型统一使用 ppocrv5 字典。
+    量化版本（*-int8）需先运行 quantize_models.py 生成
+    model_kwargs: 所有版本共用的其他 ONNXPaddleOcr 参数（如 cpu_budget、session_pool_size）
+    """
+    base_model_dir = base_model_dir or str(module_dir / "models")
+    model_map = {
+        "PP-OCRv5": "ppocrv5",
+        "PP-OCRv4": "ppocrv4",
+        "ch_ppocr_server_v2.0": "ch_ppocr_server_v2.0",
+    }
+    rec_char_dict_path = os.path.join(base_model_dir, "ppocrv5", "ppocrv5_dict.txt")
+    for name, model_dir in model_map.items():
+        model_path = os.path.join(base_model_dir, model_dir)
+        kwargs = dict(
+            use_angle_cls=use_angle_cls,
+            use_gpu=use_gpu,
+            det_model_dir=os.path.join(model_path, "det", "det.onnx"),
+            cls_model_dir=os.path.join(model_path, "cls", "cls.onnx"),
+            rec_char_dict_path=rec_char_dict_path,
+            **model_kwargs
+        )
+        rec_model_dir = os.path.join(model_path, "rec", "rec.onnx")
+        if os.path.exists(rec_model_dir):
+            kwargs["rec_model_dir"] = rec_model_dir
+        registry.register(name, **kwargs)
+        registry.register(name + "-int8", rec_quant="int8_dynamic", **kwargs)
+        # 两级识别：INT8 识别全部行，低置信度的行再用 FP32 模型识别
+        registry.register(
+            name + "-cascade",
+            rec_quant="int8_dynamic",
+            rec_cascade_model_dir=kwargs.get("rec_model_dir", infer_args().get_default("rec_model_dir")),
+            **kwargs
+        )
+    return registry
@@ -4,10 +4,18 @@ import os
 # 添加父目录到sys.path，便于导入onnxocr包
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from onnxocr.onnx_paddleocr import ONNXPaddleOcr, sav2Img
+from onnxocr.reading_order import ReadingOrder, layout_to_text, remap_layout
+from onnxocr.model_registry import ModelRegistry, register_default_models
+from onnxocr.cpu_budget import CpuBudget
+from onnxocr.job_manifest import JobManifest, config_hash
+from onnxocr.async_writer import AsyncWriter
 import cv2
 from typing import List, Callable
 from pathlib import Path
 import time
+import threading
+import unicodedata
+from collections import OrderedDict
 import numpy as np
 
 # 尝试导入pdf2image用于PDF转图片
@@ -19,36 +27,384 @@ except ImportError:
 # 尝试导入pymupdf用于PDF转图片
 try:
     import fitz  # pymupdf
+    def _render_page(page, dpi, clip=None):
+        pix = page.get_pixmap(dpi=dpi, clip=clip)
+        img = np.frombuffer(pix.samples, dtype=np.uint8)
+        img = img.reshape((pix.height, pix.width, pix.n))
+        if pix.n == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        return img
+
+    def font_text_height(page, min_chars=20, percentile=20):
+        """由文字层的字号估计字高（磅），取较小的分位数保证小字可读；文字过少时返回 None"""
+        sizes, weights = [], []
+        for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    n = len(span["text"].strip())
+                    if n:
+                        sizes.append(span["size"])
+                        weights.append(n)
+        if sum(weights) < min_chars:
+            return None
+        # 按字符数加权的分位数；字形高度约为字号的 0.7
+        order = np.argsort(sizes)
+        cum = np.cumsum(np.array(weights)[order])
+        idx = np.searchsorted(cum, cum[-1] * percentile / 100.0)
+        return sizes[order[idx]] * 0.7
+
+    def probe_text_height(page, clip=None, probe_dpi=96, min_components=10, percentile=20):
+        """
+        低分辨率试渲染，用二值化后连通域（字形）的高度估计字高（磅）；
+        没有足够的字形时返回 None
+        """
+        img = _render_page(page, probe_dpi, clip=clip)
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        _, _, cc_stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        heights = cc_stats[1:, cv2.CC_STAT_HEIGHT]
+        widths = cc_stats[1:, cv2.CC_STAT_WIDTH]
+        # 排除噪点、横线和图片、表格等大块
+        keep = (heights >= 3) & (heights <= 0.1 * binary.shape[0]) & (widths <= 8 * heights)
+        if np.count_nonzero(keep) < min_components:
+            return None
+        return float(np.percentile(heights[keep], percentile)) * 72.0 / probe_dpi
+
+    def choose_page_dpi(page, clip=None, native_dpi=None, min_dpi=100, max_dpi=300, target_text_px=16, use_fonts=True):
+        """
+        自适应渲染分辨率：选使字高不低于 target_text_px 像素的最低 DPI（以 25 为步长），
+        字号优先取自文字层，没有时低分辨率试渲染估计；
+        不超过 max_dpi，也不超过嵌入图片本身的分辨率（再高只是插值放大）
+        """
+        if native_dpi and native_dpi <= min_dpi:
+            return min_dpi
+        height_pt = font_text_height(page) if use_fonts and clip is None else None
+        if height_pt is None:
+            height_pt = probe_text_height(page, clip=clip)
+        dpi = max_dpi if height_pt is None else target_text_px * 72.0 / max(height_pt, 1e-3)
+        if native_dpi:
+            dpi = min(dpi, native_dpi)
+        dpi = int(np.ceil(dpi / 25.0) * 25)
+        return int(min(max(dpi, min_dpi), max_dpi))
+
+    def render_pdf_page(page, dpi=200, adaptive_dpi=False):
+        """
+        渲染单页为 PdfPage（整页OCR）
+        adaptive_dpi: 按页估计字高自适应选择分辨率，dpi 为上限
+        """
+        page_dpi = choose_page_dpi(page, native_dpi=scan_dpi(page), max_dpi=dpi) if adaptive_dpi else dpi
+        return PdfPage(image=_render_page(page, page_dpi), dpi=page_dpi)
+
+    def iter_pdf_pages(pdf_path, dpi=200, adaptive_dpi=False):
+        """
+        逐页渲染PDF，按需生成图片（numpy数组），整本PDF不会同时驻留内存
+        adaptive_dpi: 按页估计字高自适应选择分辨率，dpi 为上限
+        """
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                yield render_pdf_page(page, dpi, adaptive_dpi).image
+
+    def extract_text_layer(page, scale, min_chars=20, max_bad_ratio=0.1):
+        """
+        读取页面自带的文字层，按词输出与OCR结果相同结构的条目 [框四点, (文字, 1.0)]，
+        坐标按渲染比例 scale 换算为像素。
+        文字过少，或含大量无法映射到 Unicode 的字符（缺少 ToUnicode 的字体）时视为不可信，返回 None
+        """
+        words = page.get_text("words")
+        text = "".join(w[4] for w in words)
+        if len(text.strip()) < min_chars:
+            return None
+        bad = sum(1 for c in text if c == "\ufffd" or unicodedata.category(c) in ("Co", "Cc"))
+        if bad > max_bad_ratio * len(text):
+            return None
+        entries = []
+        for x0, y0, x1, y1, word in (w[:5] for w in words):
+            x0, y0, x1, y1 = x0 * scale, y0 * scale, x1 * scale, y1 * scale
+            entries.append([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]], (word, 1.0)])
+        return entries
+
+    def image_regions(page, min_area_ratio=0.05):
+        """页面中面积足够大的嵌入图片区域 [(PDF坐标区域, 图片自身分辨率 DPI)]"""
+        page_area = abs(page.rect)
+        regions = []
+        for info in page.get_image_info():
+            bbox = fitz.Rect(info["bbox"])
+            rect = bbox & page.rect
+            if not rect.is_empty and abs(rect) >= min_area_ratio * page_area:
+                native_dpi = info["width"] * 72.0 / max(bbox.width, 1e-3)
+                regions.append((rect, native_dpi))
+        return regions
+
+    def scan_dpi(page, scan_area_ratio=0.9):
+        """整页被一张图片覆盖（扫描件）时返回该图片的分辨率，否则返回 None"""
+        for rect, native_dpi in image_regions(page, min_area_ratio=scan_area_ratio):
+            return native_dpi
+        return None
+
+    def make_pdf_page_job(page, dpi=200, min_chars=20, render_text_pages=False, scan_area_ratio=0.9, adaptive_dpi=False):
+        """
+        混合模式生成单页的 PdfPage：
+        文字层可信的页直接提取文字，只渲染其中的嵌入图片区域交给OCR；
+        没有可信文字层，或整页被一张图片覆盖（扫描件，文字层多为旧的OCR结果）的页整页渲染识别。
+        render_text_pages: 文字层页是否也渲染整页（输出带框图片时需要）
+        adaptive_dpi: 需要OCR的整页和图片区域按字高自适应选择分辨率，dpi 为上限；
+            文字层坐标始终按 dpi 换算
+        """
+        scale = dpi / 72.0
+        words = extract_text_layer(page, scale, min_chars)
+        regions = image_regions(page) if words is not None else []
+        if words is None or any(abs(r) >= scan_area_ratio * abs(page.rect) for r, _ in regions):
+            return render_pdf_page(page, dpi, adaptive_dpi)
+        region_images = []
+        for rect, native_dpi in regions:
+            region_dpi = dpi
+            if adaptive_dpi:
+                region_dpi = choose_page_dpi(page, clip=rect, native_dpi=native_dpi, max_dpi=dpi)
+            region_images.append(
+                (_render_page(page, region_dpi, clip=rect), (rect.x0 * scale, rect.y0 * scale), dpi / float(region_dpi))
+            )
+        image = _render_page(page, dpi) if render_text_pages else None
+        return PdfPage(image=image, text_result=words, regions=region_images, dpi=dpi)
+
+    def iter_pdf_page_jobs(pdf_path, dpi=200, **kwargs):
+        """混合模式逐页生成 PdfPage，参数见 make_pdf_page_job"""
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                yield make_pdf_page_job(page, dpi=dpi, **kwargs)
+
+    def pdf_page_count(pdf_path):
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+
     def pdf_to_images(pdf_path, dpi=200):
         """
         使用pymupdf将PDF每一页转为图片（numpy数组）
         """
-        doc = fitz.open(pdf_path)
-        images = []
-        for page in doc:
-            pix = page.get_pixmap(dpi=dpi)
-            img = np.frombuffer(pix.samples, dtype=np.uint8)
-            img = img.reshape((pix.height, pix.width, pix.n))
-            if pix.n == 4:
-                img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            images.append(img)
-        return images
+        return list(iter_pdf_pages(pdf_path, dpi=dpi))
 except ImportError:
+    iter_pdf_pages = None
+    iter_pdf_page_jobs = None
+    make_pdf_page_job = None
+    render_pdf_page = None
+    pdf_page_count = None
     pdf_to_images = None
 
+
+class PdfPage:
+    """
+    PDF单页任务
+    image: 整页图片；text_result 为 None 时整页OCR，否则仅用于输出带框图片（可为 None）
+    text_result: 文字层提取的条目，结构与 ocr() 的单页结果相同
+    regions: 需要OCR的嵌入图片区域 [(图片, (x偏移, y偏移), 缩放)]，偏移为整页像素坐标，
+        区域图片坐标乘以缩放后加偏移得到整页坐标（区域可用不同的分辨率渲染）
+    dpi: 整页坐标对应的渲染分辨率
+    """
+    def __init__(self, image=None, text_result=None, regions=None, dpi=None):
+        self.image = image
+        self.text_result = text_result
+        self.regions = regions or []
+        self.dpi = dpi
+
+
+class OrderedPageWriter:
+    """
+    按页码顺序流式输出结果：某页及其之前的所有页都完成后立即写入文件，
+    只有乱序完成、尚未轮到写出的页文本暂存在内存中
+    writer: 后台写出器，文件的打开、追加和关闭都作为同一 key 的任务按顺序在写出线程中执行，
+        默认在调用线程中同步写入。先写入 .part 临时文件，全部写完才改名；
+        识别中途出错（with 块内抛出异常）或有一次写入失败时删除 .part，不留下不完整的输出
+    """
+    def __init__(self, txt_path=None, total=None, progress_callback=None, keep_text=False, sep="\n\n", writer=None):
+        self.txt_path = txt_path
+        self.total = total
+        self.progress_callback = progress_callback
+        self.keep_text = keep_text
+        self.sep = sep
+        self.writer = writer or AsyncWriter(max_workers=0)
+        self.texts = []
+        self._pending = {}
+        self._next = 0
+        self._done = 0
+        self._file = None
+        self._closed = False
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.txt_path:
+            self.writer.submit(self._open, key=self.txt_path)
+        return self
+
+    def _open(self):
+        try:
+            self._file = open(self.txt_path + ".part", "w", encoding="utf-8")
+        except Exception:
+            self._failed = True
+            raise
+
+    def _write(self, chunk):
+        if self._file:
+            try:
+                self._file.write(chunk)
+                self._file.flush()
+            except Exception:
+                self._failed = True
+                raise
+
+    def _close(self, discard=False):
+        if self._file:
+            self._file.close()
+            self._file = None
+        part_path = self.txt_path + ".part"
+        if discard or self._failed:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        elif os.path.exists(part_path):
+            os.replace(part_path, self.txt_path)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+    def put(self, index, text):
+        with self._lock:
+            self._pending[index] = text
+            self._done += 1
+            while self._next in self._pending:
+                page_text = self._pending.pop(self._next)
+                if self.txt_path:
+                    chunk = self.sep + page_text if self._next > 0 else page_text
+                    self.writer.submit(self._write, chunk, key=self.txt_path)
+                if self.keep_text:
+                    self.texts.append(page_text)
+                self._next += 1
+            if self.progress_callback:
+                self.progress_callback(self._done, self.total)
+
+    def text(self):
+        return self.sep.join(self.texts)
+
+    def close(self, discard=False):
+        """discard: 丢弃已写出的内容（识别出错时）"""
+        with self._lock:
+            if self.txt_path and not self._closed:
+                self._closed = True
+                self.writer.submit(self._close, discard, key=self.txt_path)
+
+INPUT_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".pdf")
+
+
+def list_input_files(input_dir, recursive=True, min_age_s=0.0):
+    """列出目录下的图片和PDF（排除输出目录），跳过最近 min_age_s 秒内修改过的文件"""
+    now = time.time()
+    files = []
+    for root, dirs, names in os.walk(input_dir):
+        dirs[:] = sorted(d for d in dirs if d != "Output_OCR") if recursive else []
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() in INPUT_EXTS and now - os.path.getmtime(path) >= min_age_s:
+                files.append(path)
+    return files
+
+
+def read_image(file):
+    """
+    读取图片，兼容中文路径
+    return: (图片, 错误信息)，读取失败时图片为 None
+    """
+    try:
+        if file.lower().endswith('.bmp'):
+            img = cv2.imdecode(np.fromfile(file, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            with open(file, 'rb') as fimg:
+                img_array = np.frombuffer(fimg.read(), np.uint8)
+            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    except Exception as e:
+        return None, f"图片读取失败: {file}，错误: {e}"
+    if img is None:
+        return None, f"文件无法读取或不是有效图片: {file}"
+    return img, None
+
+
+# 进程池后端：工作进程内的全局状态，由 _process_worker_init 在每个进程中初始化一次
+_worker_logic = None
+_worker_docs = OrderedDict()
+
+
+def _process_worker_init(model_name, model_kwargs):
+    global _worker_logic
+    registry = ModelRegistry(max_models=1)
+    registry.register(model_name, **model_kwargs)
+    # 工作进程内同步写出，任务返回时输出已落盘
+    _worker_logic = OCRLogic(lambda msg: None, registry=registry, model_name=model_name, writer_workers=0)
+
+
+def _worker_open_pdf(pdf_path, max_docs=4):
+    """工作进程内缓存最近打开的PDF，任务只传路径和页码"""
+    doc = _worker_docs.pop(pdf_path, None)
+    if doc is None:
+        doc = fitz.open(pdf_path)
+    _worker_docs[pdf_path] = doc
+    while len(_worker_docs) > max_docs:
+        _worker_docs.popitem(last=False)[1].close()
+    return doc
+
+
+def _process_worker_ocr_file(file, save_txt, output_img, txt_path=None):
+    """工作进程：按路径读取并识别单张图片，return: (文本, 错误信息)"""
+    img, err = read_image(file)
+    if err:
+        return "", err
+    return _worker_logic._ocr_image(img, file, save_txt, output_img=output_img, txt_path=txt_path), None
+
+
+def _process_worker_ocr_pdf_page(pdf_path, index, page_options, out_dir, output_img):
+    """工作进程：自行打开PDF、渲染并识别一页，return: (页文本, 页类型)"""
+    page = _worker_open_pdf(pdf_path)[index]
+    if page_options.get("use_text_layer"):
+        job = make_pdf_page_job(page, dpi=page_options["dpi"], render_text_pages=output_img, adaptive_dpi=page_options["adaptive_dpi"])
+    else:
+        job = render_pdf_page(page, page_options["dpi"], page_options["adaptive_dpi"])
+    return _worker_logic._ocr_pdf_page_text(index, job, _worker_logic.model, pdf_path, out_dir, output_img)
+
+
 class OCRLogic:
     """
     OCR 业务逻辑主类，支持批量图片/PDF识别，多线程加速，模型热切换等
     """
-    def __init__(self, status_callback: Callable[[str], None]):
+    def __init__(self, status_callback: Callable[[str], None], registry: ModelRegistry = None, model_name: str = "PP-OCRv5", cpu_budget: int = 0, max_workers: int = 4, writer_workers: int = 2, shared_weights: bool = False):
         """
         初始化，传入状态回调函数用于UI进度提示
+        registry: 模型注册表，默认登记内置模型
+        model_name: 默认使用的模型
+        cpu_budget: CPU核数预算（-1 表示全部核，0 表示不管理），在识别线程、OpenCV 和 onnxruntime 线程之间分配
+        max_workers: 默认并发数，启用CPU预算时不超过核数
+        writer_workers: 后台写出线程数（txt、合并结果、带框图片），0 表示在识别线程中同步写出
+        shared_weights: 加载 shared_weights.py 生成的共享权重模型，进程池后端的各工作进程共用一份权重内存
         """
         self.status_callback = status_callback
+        self.cpu_budget = CpuBudget(max(cpu_budget, 0), max_workers) if cpu_budget else None
+        self.max_workers = self.cpu_budget.workers if self.cpu_budget else max_workers
+        model_kwargs = {}
+        if self.cpu_budget:
+            # 每个识别线程一组独立的会话，线程数按预算分配
+            model_kwargs = dict(cpu_budget=self.cpu_budget.cores, cpu_workers=self.max_workers, session_pool_size=self.max_workers)
+            status_callback(self.cpu_budget.describe())
+        if shared_weights:
+            model_kwargs["shared_weights"] = True
+        # 模型注册表：各模型版本懒加载，按LRU保留
+        self.registry = registry or register_default_models(ModelRegistry(max_models=2), **model_kwargs)
         # 默认初始化OCR模型
-        self.model = ONNXPaddleOcr(use_angle_cls=True, use_gpu=False)
+        self.model_name = model_name
+        self.model = self.registry.get(self.model_name)
+        # 文字层与OCR结果合并后的阅读顺序
+        self.reading_order = ReadingOrder()
+        # 进程池后端，按 (模型, 进程数) 复用
+        self._process_pool = None
+        self._process_pool_key = None
+        # 结果的写出和带框图片的绘制不占用识别线程；排队上限同时限制等待绘制的页图片数
+        self.writer = AsyncWriter(max_workers=writer_workers, max_pending=8)
 
-    def run(self, files: List[str], save_txt: bool, merge_txt: bool, output_img: bool = False, file_time_callback=None, pdf_progress_callback=None, max_workers: int = 4):
+    def run(self, files: List[str], save_txt: bool, merge_txt: bool, output_img: bool = False, file_time_callback=None, pdf_progress_callback=None, max_workers: int = None, model_name: str = None, prefetch_pages: int = 2, use_text_layer: bool = True, adaptive_dpi: bool = True, backend: str = "thread", manifest_path: str = None):
         """
         批量图片/PDF识别主入口，支持多线程加速
         files: 待识别文件路径列表
@@ -57,43 +413,115 @@ class OCRLogic:
         output_img: 是否输出带框图片
         file_time_callback: 单文件识别耗时回调
         pdf_progress_callback: PDF页进度回调
-        max_workers: 最大线程数，默认4
+        max_workers: 最大线程数，默认取初始化时的 max_workers；启用CPU预算时不超过预算的并发数
+        model_name: 本次使用的模型版本（注册表中的名称），默认使用当前模型
+        prefetch_pages: PDF预渲染页数上限，与线程数一起决定同时驻留内存的页图片数
+        use_text_layer: PDF混合模式，文字层可信的页直接提取文字，只对图片页/图片区域做OCR
+        adaptive_dpi: PDF按页估计字高，以能保证识别效果的最低分辨率渲染（不超过300DPI）
+        backend: "thread" 线程池，所有线程共用同一个模型；
+            "process" 进程池，每个工作进程各自加载一次模型，任务只传文件路径和页码
+        manifest_path: 任务清单路径（需 save_txt）。提供时按内容哈希和配置哈希跳过已完成的文件、
+            重试失败的文件，输出文件名使用内容哈希而不是时间戳；单个文件失败只记录不中断整批
         """
         import concurrent.futures
         start_time = time.time()
+        if backend not in ("thread", "process"):
+            raise ValueError(f"unknown executor backend: {backend}")
+        if manifest_path and not save_txt:
+            raise ValueError("manifest_path requires save_txt")
+        max_workers = max_workers or self.max_workers
+        if self.cpu_budget:
+            max_workers = min(max_workers, self.cpu_budget.workers)
+        pool, model = None, None
+        if backend == "process":
+            pool = self._get_process_pool(max_workers, model_name or self.model_name)
+        else:
+            # 整批任务固定使用同一个模型对象，期间切换模型不影响本批
+            model = self.registry.get(model_name) if model_name else self.model
+        page_options = dict(dpi=300, use_text_layer=use_text_layer, adaptive_dpi=adaptive_dpi)
+        manifest, cfg_hash = None, None
+        if manifest_path:
+            manifest = JobManifest(manifest_path)
+            name = model_name or self.model_name
+            cfg_hash = config_hash(dict(self.registry.config(name), model=name, output_img=output_img, **page_options))
         all_text = [None] * len(files)  # 用于顺序合并结果
-        def process_one(idx_file):
-            idx, file = idx_file
+        # 只有合并输出时才需要在内存中保留PDF全文
+        keep_text = save_txt and merge_txt and len(files) > 1
+        def ocr_one(file, txt_path):
+            """识别单个文件，return: (文本, 错误信息)"""
             ext = os.path.splitext(file)[1].lower()
-            self.status_callback(f"正在处理: {os.path.basename(file)} ({idx+1}/{len(files)})")
-            t0 = time.time()
-            text = ""
+            text, err = "", None
             if ext == ".pdf":
                 # PDF转图片后识别
-                if pdf_to_images is None:
+                if iter_pdf_pages is None:
                     raise RuntimeError("未安装pymupdf库，无法处理PDF文件。请先安装pymupdf。")
-                images = pdf_to_images(file, dpi=300)
-                text = self._ocr_images(images, file, save_txt, merge_txt, output_img=output_img, is_pdf=True, pdf_progress_callback=pdf_progress_callback, max_workers=max_workers)
+                total = pdf_page_count(file)
+                if pool is not None:
+                    # 工作进程按页码自行渲染
+                    pages = range(total)
+                elif use_text_layer:
+                    # 逐页渲染，边渲染边识别
+                    pages = iter_pdf_page_jobs(file, dpi=300, render_text_pages=output_img, adaptive_dpi=adaptive_dpi)
+                else:
+                    pages = iter_pdf_pages(file, dpi=300, adaptive_dpi=adaptive_dpi)
+                pdf_stats = {}
+                text = self._ocr_images(pages, file, save_txt, merge_txt, output_img=output_img, is_pdf=True, pdf_progress_callback=pdf_progress_callback, max_workers=max_workers, model=model, total=total, prefetch=prefetch_pages, keep_text=keep_text, stats=pdf_stats, pool=pool, page_options=page_options, txt_path=txt_path)
+                self.status_callback(
+                    f"{os.path.basename(file)}: 共 {pdf_stats['pages']} 页，OCR {pdf_stats['ocr_pages']} 页，"
+                    f"文字层提取 {pdf_stats['text_pages'] + pdf_stats['mixed_pages']} 页（其中 {pdf_stats['mixed_pages']} 页含OCR图片区域）"
+                )
             else:
                 # 普通图片识别，兼容中文路径
-                try:
-                    if file.lower().endswith('.bmp'):
-                        img = cv2.imdecode(np.fromfile(file, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if pool is not None:
+                    text, err = pool.submit(_process_worker_ocr_file, file, save_txt, output_img, txt_path).result()
+                else:
+                    img, err = read_image(file)
+                    if err is None:
+                        text = self._ocr_image(img, file, save_txt, output_img=output_img, model=model, txt_path=txt_path)
+            return text, err
+        def record_result(file, content_hash, txt_path, err):
+            """在写出线程中记录结果：同一 key 之前的写出有失败（如磁盘已满）时记为失败"""
+            write_err = self.writer.key_error(txt_path)
+            if err is None and write_err is not None:
+                err = f"写出失败: {txt_path}，错误: {write_err}"
+            manifest.record(file, content_hash, cfg_hash, "failed" if err else "done", output=None if err else txt_path, error=err)
+        def process_one(idx_file):
+            idx, file = idx_file
+            self.status_callback(f"正在处理: {os.path.basename(file)} ({idx+1}/{len(files)})")
+            t0 = time.time()
+            txt_path = None
+            if manifest is not None:
+                content_hash = manifest.content_hash(file)
+                txt_path = os.path.join(self._get_output_dir(file), f"{Path(file).stem}_ocr_{content_hash[:12]}.txt")
+                done = manifest.completed(content_hash, cfg_hash)
+                if done:
+                    output = done["output"]
+                    # 内容相同、路径不同的文件：把已有结果写到本文件自己的输出位置
+                    need_copy = bool(output) and output != txt_path and not os.path.exists(txt_path)
+                    text = self._read_text(output) if output and (keep_text or need_copy) else ""
+                    if need_copy:
+                        self.writer.write_text(txt_path, text)
+                        self.writer.submit(record_result, file, content_hash, txt_path, None, key=txt_path)
+                        self.status_callback(f"内容与已识别文件相同，复用结果: {os.path.basename(file)}")
                     else:
-                        with open(file, 'rb') as fimg:
-                            img_array = np.frombuffer(fimg.read(), np.uint8)
-                        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                except Exception as e:
-                    self.status_callback(f"图片读取失败: {file}，错误: {e}")
-                    if file_time_callback:
-                        file_time_callback(idx, 0)
-                    return (idx, "")
-                if img is None:
-                    self.status_callback(f"文件无法读取或不是有效图片: {file}")
+                        self.status_callback(f"已识别过，跳过: {os.path.basename(file)}")
                     if file_time_callback:
                         file_time_callback(idx, 0)
-                    return (idx, "")
-                text = self._ocr_image(img, file, save_txt, output_img=output_img)
+                    return (idx, text if keep_text else "")
+            try:
+                text, err = ocr_one(file, txt_path)
+            except Exception as e:
+                if manifest is None:
+                    raise
+                text, err = "", f"识别失败: {file}，错误: {e}"
+            if manifest is not None:
+                # 与txt的写出任务同一 key，排在这些任务之后执行
+                self.writer.submit(record_result, file, content_hash, txt_path, err, key=txt_path)
+            if err:
+                self.status_callback(err)
+                if file_time_callback:
+                    file_time_callback(idx, 0)
+                return (idx, "")
             t1 = time.time()
             if file_time_callback:
                 file_time_callback(idx, t1-t0)
@@ -103,21 +531,25 @@ class OCRLogic:
                 self.status_callback(f"已完成 {idx+1}/{len(files)}，平均单张用时: {avg:.2f} 秒")
             return (idx, text)
         # 多线程处理所有文件，结果按索引回填，保证顺序
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(process_one, (idx, file)) for idx, file in enumerate(files)]
-            for future in concurrent.futures.as_completed(futures):
-                idx, text = future.result()
-                all_text[idx] = text
-        # 合并写入txt
-        if save_txt and merge_txt and len(files) > 1:
-            out_dir = self._get_output_dir(files[0])
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            out_txt = os.path.join(out_dir, f"merged_ocr_{timestamp}.txt")
-            with open(out_txt, "w", encoding="utf-8") as f:
-                for text in all_text:
-                    if text:
-                        f.write(text)
-                        f.write("\n\n")
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(process_one, (idx, file)) for idx, file in enumerate(files)]
+                for future in concurrent.futures.as_completed(futures):
+                    idx, text = future.result()
+                    all_text[idx] = text
+            # 合并写入txt
+            if save_txt and merge_txt and len(files) > 1:
+                out_dir = self._get_output_dir(files[0])
+                timestamp = time.strftime("%Y%m%d_%H%M%S")
+                out_txt = os.path.join(out_dir, f"merged_ocr_{timestamp}.txt")
+                self.writer.write_text(out_txt, "".join(text + "\n\n" for text in all_text if text))
+            # 返回前所有输出都已落盘
+            self.writer.flush()
+        finally:
+            # 出错时也等已提交的输出写完，再关闭清单
+            self.writer.flush(raise_errors=False)
+            if manifest is not None:
+                manifest.close()
         elapsed = time.time() - start_time
         if files:
             out_dir = self._get_output_dir(files[0])
@@ -125,69 +557,182 @@ class OCRLogic:
         else:
             self.status_callback(f"识别完成，总耗时：{elapsed:.2f}秒")
 
-    def _ocr_images(self, images, pdf_path, save_txt, merge_txt, output_img=False, is_pdf=False, pdf_progress_callback=None, max_workers: int = 4):
+    def _ocr_images(self, images, pdf_path, save_txt, merge_txt, output_img=False, is_pdf=False, pdf_progress_callback=None, max_workers: int = 4, model=None, total=None, prefetch: int = 2, keep_text: bool = True, stats=None, pool=None, page_options=None, txt_path=None):
         """
-        PDF转图片后，批量图片识别，支持多线程加速
-        images: PDF每页图片（numpy数组）
+        PDF页图片流水线识别：按需取页、多线程识别、按页码顺序流式写出
+        images: PDF每页图片（numpy数组）或 PdfPage 的列表或生成器，按需逐页读取
         pdf_path: 原PDF路径
         save_txt: 是否保存txt
         merge_txt: 是否合并txt（未用）
         output_img: 是否输出带框图片
-        pdf_progress_callback: 页进度回调
+        pdf_progress_callback: 页进度回调 (已完成页数, 总页数)
         max_workers: 最大线程数，默认4
+        model: 使用的模型，默认当前模型
+        total: 总页数，images 为生成器时用于进度提示
+        prefetch: 已渲染、等待识别的页数上限；同时驻留内存的页图片不超过 max_workers + prefetch + 1
+        keep_text: 是否返回全文；为False时文本只写入文件，返回空字符串
+        stats: 可选的 dict，返回各类页数 pages / ocr_pages / text_pages / mixed_pages
+        pool: 进程池后端；提供时 images 为页码，由工作进程按 page_options 自行渲染识别
+        txt_path: txt输出路径，默认按时间戳命名
         """
         import concurrent.futures
+        model = model or self.model
         out_dir = self._get_output_dir(pdf_path)
-        pdf_text = [None] * len(images)
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        total = len(images)
-        def process_page(i_img):
-            i, img = i_img
-            img_cv = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-            result = self.model.ocr(img_cv)
-            if output_img:
-                out_img_path = os.path.join(out_dir, f"{Path(pdf_path).stem}_page{i+1}_ocr.jpg")
-                sav2Img(img_cv, result, name=out_img_path)
-            page_text = self._result_to_text(result)
-            return (i, page_text)
-        # 多线程识别每一页，结果按页码顺序合并
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(process_page, (i, img)) for i, img in enumerate(images)]
-            for future in concurrent.futures.as_completed(futures):
-                i, page_text = future.result()
-                pdf_text[i] = page_text
-                if pdf_progress_callback:
-                    pdf_progress_callback(i + 1, total)
-        if save_txt:
+        if total is None and hasattr(images, "__len__"):
+            total = len(images)
+        if save_txt and txt_path is None:
             txt_path = os.path.join(out_dir, f"{Path(pdf_path).stem}_ocr_{timestamp}.txt")
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write("\n\n".join(pdf_text))
-        return "\n\n".join(pdf_text)
+        elif not save_txt:
+            txt_path = None
+        # 在途页数（排队+识别中）的上限，取页在获得名额后才进行
+        slots = threading.BoundedSemaphore(max_workers + max(prefetch, 0))
+        stats = {} if stats is None else stats
+        stats.update(pages=0, ocr_pages=0, text_pages=0, mixed_pages=0)
+        stats_lock = threading.Lock()
+        def record_page(i, future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            text, kind = future.result()
+            with stats_lock:
+                stats["pages"] += 1
+                stats[kind + "_pages"] += 1
+            writer.put(i, text)
+        with OrderedPageWriter(txt_path, total, pdf_progress_callback, keep_text, writer=self.writer) as writer:
+            executor = pool or concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            futures = set()
+            try:
+                pages = iter(images)
+                i = 0
+                while True:
+                    slots.acquire()
+                    page = next(pages, None)
+                    if page is None:
+                        slots.release()
+                        break
+                    if pool is not None:
+                        future = executor.submit(_process_worker_ocr_pdf_page, pdf_path, page, page_options, out_dir, output_img)
+                    else:
+                        future = executor.submit(self._ocr_pdf_page_text, i, page, model, pdf_path, out_dir, output_img)
+                    future.add_done_callback(lambda f, i=i: record_page(i, f))
+                    future.add_done_callback(lambda f: slots.release())
+                    futures.add(future)
+                    del page
+                    i += 1
+                    # 及时抛出已失败页的异常，并释放已完成的 future
+                    finished = {f for f in futures if f.done()}
+                    for f in finished:
+                        f.result()
+                    futures -= finished
+                for f in concurrent.futures.as_completed(futures):
+                    f.result()
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                concurrent.futures.wait(futures)
+                raise
+            finally:
+                if pool is None:
+                    executor.shutdown(wait=True)
+        return writer.text() if keep_text else ""
 
-    def _ocr_image(self, img, img_path, save_txt, output_img=False):
+    def _ocr_pdf_page_text(self, i, page, model, pdf_path, out_dir, output_img=False):
+        """
+        识别PDF第 i 页（页图片或 PdfPage），按需输出带框图片
+        return: (页文本, 页类型)
+        """
+        if not isinstance(page, PdfPage):
+            page = PdfPage(image=page)
+        result, layout, kind = self._ocr_pdf_page(page, model)
+        if output_img and page.image is not None:
+            out_img_path = os.path.join(out_dir, f"{Path(pdf_path).stem}_page{i+1}_ocr.jpg")
+            # 页图片为RGB，sav2Img 需要BGR，传通道翻转的视图，由写出线程绘制
+            self.writer.submit(sav2Img, page.image[:, :, ::-1], result, name=out_img_path, key=out_img_path)
+        return self._result_to_text(result, layout), kind
+
+    def _ocr_pdf_page(self, page, model):
+        """
+        识别PDF单页
+        return: (result, layout, 页类型)，页类型为 "ocr"（整页OCR）、"text"（仅文字层）
+            或 "mixed"（文字层 + 图片区域OCR）
+        """
+        if page.text_result is None:
+            stats = {}
+            result = model.ocr(cv2.cvtColor(np.array(page.image), cv2.COLOR_RGB2BGR), stats=stats)
+            return result, stats.get("layout"), "ocr"
+        entries = list(page.text_result)
+        region_entries = []
+        for region_img, (x_off, y_off), scale in page.regions:
+            region_result = model.ocr(cv2.cvtColor(region_img, cv2.COLOR_RGB2BGR))
+            for box, res in region_result[0]:
+                region_entries.append([[[x * scale + x_off, y * scale + y_off] for x, y in box], res])
+        if page.regions:
+            # 图片上叠加的文字层（如旧的隐藏OCR文字）以本次OCR结果为准，避免重复
+            entries = [e for e in entries if not self._in_regions(e[0], page.regions)]
+        entries += region_entries
+        layout = self.reading_order([box for box, _ in entries])
+        entries = [entries[b] for b in layout["order"]]
+        layout = remap_layout(layout, list(range(len(entries))))
+        return [entries], layout, "mixed" if page.regions else "text"
+
+    @staticmethod
+    def _in_regions(box, regions):
+        cx = sum(x for x, _ in box) / len(box)
+        cy = sum(y for _, y in box) / len(box)
+        for region_img, (x_off, y_off), scale in regions:
+            h, w = region_img.shape[0] * scale, region_img.shape[1] * scale
+            if x_off <= cx <= x_off + w and y_off <= cy <= y_off + h:
+                return True
+        return False
+
+    def _ocr_image(self, img, img_path, save_txt, output_img=False, model=None, txt_path=None):
         """
         单张图片OCR识别，支持保存txt和输出带框图片
+        txt_path: txt输出路径，默认按时间戳命名
         """
+        model = model or self.model
         out_dir = self._get_output_dir(img_path)
-        result = self.model.ocr(img)
+        stats = {}
+        result = model.ocr(img, stats=stats)
         if output_img:
             out_img_path = os.path.join(out_dir, f"{Path(img_path).stem}_ocr.jpg")
-            sav2Img(img, result, name=out_img_path)
-        text = self._result_to_text(result)
+            self.writer.submit(sav2Img, img, result, name=out_img_path, key=out_img_path)
+        text = self._result_to_text(result, stats.get("layout"))
         if save_txt:
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            txt_path = os.path.join(out_dir, f"{Path(img_path).stem}_ocr_{timestamp}.txt")
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(text)
+            if txt_path is None:
+                timestamp = time.strftime("%Y%m%d_%H%M%S")
+                txt_path = os.path.join(out_dir, f"{Path(img_path).stem}_ocr_{timestamp}.txt")
+            self.writer.write_text(txt_path, text)
         return text
 
-    def _result_to_text(self, result):
+    @staticmethod
+    def _read_text(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def run_directory(self, input_dir: str, recursive: bool = True, min_age_s: float = 5.0, manifest_path: str = None, **kwargs):
+        """
+        增量识别目录：每次调用只识别新增、修改过或上次失败的文件
+        min_age_s: 跳过最近 min_age_s 秒内修改过的文件（可能仍在写入），下次运行再处理
+        manifest_path: 任务清单路径，默认为 <input_dir>/Output_OCR/ocr_manifest.jsonl
+        其余参数同 run，save_txt 默认为 True
+        """
+        files = list_input_files(input_dir, recursive=recursive, min_age_s=min_age_s)
+        manifest_path = manifest_path or os.path.join(input_dir, "Output_OCR", "ocr_manifest.jsonl")
+        kwargs.setdefault("save_txt", True)
+        kwargs.setdefault("merge_txt", False)
+        return self.run(files, manifest_path=manifest_path, **kwargs)
+
+    def _result_to_text(self, result, layout=None):
         """
         将OCR识别结果结构化为纯文本，兼容只检测无识别内容的情况
+        layout: 阅读顺序结构（行/段落），提供时按行、段落排版输出
         """
         # 健壮性检查，防止result为空或结构异常
         if not result or not isinstance(result, list) or not result[0] or not isinstance(result[0], list):
             return "[未检测到内容]"
+        if layout and len(layout["order"]) == len(result[0]):
+            return layout_to_text([str(box[1][0]) for box in result[0]], layout)
         lines = []
         for box in result[0]:
             # 兼容只检测无识别内容的情况
@@ -212,57 +757,69 @@ class OCRLogic:
     def set_model(self, model_name, use_gpu=False):
         """
         切换OCR模型，支持多模型热切换，所有模型统一用ppocrv5字典
+        模型从注册表懒加载并缓存，切换只是原子地替换 self.model，
+        正在进行的识别继续使用旧模型完成
         use_gpu: 是否启用GPU
         """
-        import os
-        import tkinter.messagebox as messagebox
-        base_model_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "onnxocr", "models"))
-        model_map = {
-            "PP-OCRv5": "ppocrv5",
-            "PP-OCRv4": "ppocrv4",
-            "ch_ppocr_server_v2.0": "ch_ppocr_server_v2.0"
-        }
-        model_dir = model_map.get(model_name, "ppocrv5")
-        model_path = os.path.join(base_model_dir, model_dir)
-        det_model_dir = os.path.join(model_path, "det", "det.onnx")
-        cls_model_dir = os.path.join(model_path, "cls", "cls.onnx")
-        rec_char_dict_path = os.path.join(base_model_dir, "ppocrv5", "ppocrv5_dict.txt")
-        rec_model_dir = os.path.join(model_path, "rec", "rec.onnx") if os.path.exists(os.path.join(model_path, "rec", "rec.onnx")) else None
-        ocr_kwargs = dict(
-            use_angle_cls=True,
-            use_gpu=use_gpu,  # 关键：传递GPU参数
-            det_model_dir=det_model_dir,
-            cls_model_dir=cls_model_dir,
-            rec_char_dict_path=rec_char_dict_path
+        name = model_name if model_name in self.registry.names() else "PP-OCRv5"
+        if use_gpu:
+            gpu_name = name + "@gpu"
+            if gpu_name not in self.registry.names():
+                kwargs = dict(self.registry.config(name), use_gpu=True)
+                self.registry.register(gpu_name, **kwargs)
+            try:
+                model = self.registry.get(gpu_name)
+                providers = model.text_detector.det_onnx_session.get_providers()
+                if not any('CUDA' in p for p in providers):
+                    self._report_gpu_fallback("未检测到可用GPU，已自动切换为CPU推理。请检查CUDA/cuDNN环境配置。")
+                self.model_name = gpu_name
+                self.model = model
+                return
+            except Exception as e:
+                self.registry.evict(gpu_name)
+                self._report_gpu_fallback(f"GPU初始化失败，已自动切换为CPU。请检查CUDA/cuDNN环境配置。错误信息: {e}")
+        self.model = self.registry.get(name)
+        self.model_name = name
+
+    def _get_process_pool(self, max_workers, model_name):
+        """
+        进程池后端：每个工作进程初始化时创建一次自己的模型，
+        onnxruntime 和 OpenCV 线程数按进程数均分CPU（或CPU预算），避免各进程线程池互相争抢
+        """
+        import concurrent.futures
+        import multiprocessing
+        key = (model_name, max_workers)
+        if self._process_pool is not None and self._process_pool_key == key:
+            return self._process_pool
+        self.close()
+        kwargs = self.registry.config(model_name)
+        budget = CpuBudget(self.cpu_budget.cores if self.cpu_budget else 0, max_workers)
+        # 每个进程只有一个识别调用，分到的核数即该进程的预算
+        kwargs.update(cpu_budget=budget.threads_per_worker, cpu_workers=1, session_pool_size=1)
+        kwargs.pop("intra_op_num_threads", None)
+        # spawn：不继承父进程已加载的模型和onnxruntime线程状态
+        self._process_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_process_worker_init,
+            initargs=(model_name, kwargs),
         )
-        if rec_model_dir and os.path.exists(rec_model_dir):
-            ocr_kwargs["rec_model_dir"] = rec_model_dir
-        try:
-            self.model = ONNXPaddleOcr(**ocr_kwargs)
-            if use_gpu:
-                try:
-                    import onnxruntime as ort
-                    providers = self.model.session.get_providers() if hasattr(self.model, 'session') else []
-                    if not any('CUDA' in p for p in providers):
-                        msg = ("未检测到可用GPU，已自动切换为CPU推理。请检查CUDA/cuDNN环境配置。")
-                        if hasattr(self, 'ui_ref') and hasattr(self.ui_ref, 'update_gpu_status'):
-                            self.ui_ref.update_gpu_status(msg)
-                        if hasattr(self, 'status_callback'):
-                            self.status_callback("[警告] 未检测到可用GPU，已切换为CPU推理。请检查CUDA/cuDNN环境配置。")
-                except Exception:
-                    msg = ("检测GPU状态时发生异常，可能未正确安装CUDA/cuDNN或onnxruntime-gpu。已自动切换为CPU推理。")
-                    if hasattr(self, 'ui_ref') and hasattr(self.ui_ref, 'update_gpu_status'):
-                        self.ui_ref.update_gpu_status(msg)
-                    if hasattr(self, 'status_callback'):
-                        self.status_callback("[警告] GPU检测异常，已切换为CPU推理。请检查CUDA/cuDNN环境配置。")
-        except Exception as e:
-            if use_gpu:
-                msg = f"GPU初始化失败，已自动切换为CPU。请检查CUDA/cuDNN环境配置。错误信息: {e}"
-                if hasattr(self, 'ui_ref') and hasattr(self.ui_ref, 'update_gpu_status'):
-                    self.ui_ref.update_gpu_status(msg)
-                if hasattr(self, 'status_callback'):
-                    self.status_callback("[警告] GPU初始化失败，已切换为CPU推理。请检查CUDA/cuDNN环境配置。")
-                ocr_kwargs["use_gpu"] = False
-                self.model = ONNXPaddleOcr(**ocr_kwargs)
-            else:
-                raise
+        self._process_pool_key = key
+        return self._process_pool
+
+    def close(self):
+        """关闭进程池后端的工作进程，等待后台写出完成"""
+        self.writer.flush(raise_errors=False)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
+            self._process_pool = None
+            self._process_pool_key = None
+
+    def _report_gpu_fallback(self, msg):
+        """
+        GPU不可用时通知界面和状态栏
+        """
+        if hasattr(self, 'ui_ref') and hasattr(self.ui_ref, 'update_gpu_status'):
+            self.ui_ref.update_gpu_status(msg)
+        if hasattr(self, 'status_callback'):
+            self.status_callback("[警告] " + msg)
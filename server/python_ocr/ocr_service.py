@@ -17,29 +17,101 @@ current_dir = Path(__file__).parent
 sys.path.insert(0, str(current_dir))
 
 from onnx_paddleocr import ONNXPaddleOcr
+from image_decode import read_image_file, scale_result
+from doc_templates import DEFAULT_TEMPLATE_DIR, TemplateOCR
 
 def main():
-    if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python ocr_service.py <image_path>"}))
+    # --triage: only return the quality verdict (no recognition)
+    # --quality_gate: reject bad photos before running full OCR
+    # --template[=name]: read the fields of a known ID card layout (templates/*.json),
+    #     falling back to full-page OCR when no template matches
+    # --refine: re-recognize low-confidence lines from the full-resolution image
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    argv = [a for a in sys.argv[1:] if not a.startswith("--")]
+    unknown = {f for f in flags if f.split("=")[0] not in ("--triage", "--quality_gate", "--template", "--refine")}
+    if len(argv) not in (1, 2) or unknown:
+        print(json.dumps({"error": "Usage: python ocr_service.py <image_path> [deadline_ms] [--triage] [--quality_gate] [--template[=name]] [--refine]"}))
         sys.exit(1)
+    template_flag = next((f for f in flags if f.split("=")[0] == "--template"), None)
     
     try:
         # Get image path from command line
-        image_path = sys.argv[1]
-        
-        # Load image directly from file
-        img = cv2.imread(image_path)
+        image_path = argv[0]
+        # Optional response-time budget in milliseconds
+        deadline_ms = float(argv[1]) if len(argv) == 2 else None
         
+        # Initialize OCR model - exact same as working temp code
+        model = ONNXPaddleOcr(use_angle_cls=False, use_gpu=False, use_refine="--refine" in flags)
+
+        # Decode at the smallest resolution detection and crops still need;
+        # boxes are mapped back to original-image coordinates below
+        args = model.args
+        img, scale = read_image_file(
+            image_path, args.det_limit_side_len * args.decode_crop_scale, args.det_limit_type
+        )
+
         if img is None:
             print(json.dumps({"error": "Failed to load image"}))
             sys.exit(1)
-        
-        # Initialize OCR model - exact same as working temp code
-        model = ONNXPaddleOcr(use_angle_cls=False, use_gpu=False)
-        
+
+        # Blur / exposure / glare / text-area check on a downscaled copy
+        quality = None
+        if "--triage" in flags or "--quality_gate" in flags:
+            quality = model.triage(img)
+            if "--triage" in flags or not quality["accept"]:
+                print(json.dumps({
+                    "success": "--triage" in flags,
+                    "rejected": not quality["accept"],
+                    "quality": quality
+                }))
+                return
+
+        # Known ID card layout: recognize only the field regions
+        if template_flag is not None:
+            start_time = time.time()
+            template_ocr = TemplateOCR(model)
+            template_ocr.load(DEFAULT_TEMPLATE_DIR)
+            template_result = template_ocr(img, template_flag.partition("=")[2] or None)
+            if template_result is not None:
+                sx, sy = scale
+                ocr_results = []
+                for name, field in template_result["fields"].items():
+                    field["box"] = [[x * sx, y * sy] for x, y in field["box"]]
+                    ocr_results.append({
+                        "box": field["box"],
+                        "text": field["text"],
+                        "confidence": field["confidence"],
+                        "field": name
+                    })
+                texts = [r["text"] for r in ocr_results if r["text"]]
+                response = {
+                    "success": True,
+                    "template": template_result["template"],
+                    "template_score": template_result["score"],
+                    "fields": template_result["fields"],
+                    "results": ocr_results,
+                    "processing_time": time.time() - start_time,
+                    "total_texts": len(texts),
+                    "extracted_text": " ".join(texts),
+                    "lines": texts,
+                    "paragraphs": [texts] if texts else [],
+                    "partial": False
+                }
+                if quality is not None:
+                    response["quality"] = quality
+                print(json.dumps(response))
+                return
+
         # Run OCR
         start_time = time.time()
-        result = model.ocr(img)
+        stats = {}
+        # Low-confidence lines are re-cropped from a full-size decode, made only when needed
+        refine_source = None
+        if scale != (1.0, 1.0):
+            refine_source = lambda: (read_image_file(image_path)[0], scale)
+        result = scale_result(
+            model.ocr(img, stats=stats, deadline_ms=deadline_ms, refine_source=refine_source), scale
+        )
         end_time = time.time()
         
         # Format results for Node.js
@@ -57,14 +129,31 @@ def main():
                     "confidence": confidence
                 })
         
+        # Line / paragraph structure in reading order
+        texts = [r["text"] for r in ocr_results]
+        layout = stats.get("layout")
+        lines = []
+        paragraphs = []
+        if layout:
+            lines = [" ".join(texts[i] for i in line) for line in layout["lines"]]
+            paragraphs = [[lines[i] for i in paragraph] for paragraph in layout["paragraphs"]]
+
         # Return JSON response
         response = {
             "success": True,
             "results": ocr_results,
             "processing_time": end_time - start_time,
             "total_texts": len(ocr_results),
-            "extracted_text": " ".join([r["text"] for r in ocr_results])
+            "extracted_text": " ".join(texts),
+            "lines": lines,
+            "paragraphs": paragraphs,
+            "partial": stats.get("partial", False)
         }
+        if quality is not None:
+            response["quality"] = quality
+        if template_flag is not None:
+            # No template matched; full-page results above
+            response["template"] = None
         
         print(json.dumps(response))
         
@@ -1,8 +1,10 @@
 import time
+import os
 
 from predict_system import TextSystem
+from quality_gate import QualityGate
 from utils import infer_args as init_args
-from utils import str2bool, draw_ocr
+from utils import str2bool, draw_ocr, quantized_model_path, shared_model_path
 import argparse
 import sys
 
@@ -22,18 +24,58 @@ class ONNXPaddleOcr(TextSystem):
         # 根据传入的参数覆盖更新默认参数
         params.__dict__.update(**kwargs)
 
+        # 按阶段选择量化模型，例如 rec_quant="int8_dynamic"；rec_cascade 为两级识别的第二级
+        for stage in ("det", "cls", "rec", "rec_cascade"):
+            if not getattr(params, stage + "_model_dir"):
+                continue
+            model_dir = quantized_model_path(
+                getattr(params, stage + "_model_dir"), getattr(params, stage + "_quant", None)
+            )
+            if model_dir != getattr(params, stage + "_model_dir") and not os.path.exists(
+                model_dir
+            ):
+                raise FileNotFoundError(
+                    "{} not found, run quantize_models.py to generate it".format(model_dir)
+                )
+            # 共享权重版本，例如 rec/rec_int8_dynamic_shared.onnx
+            if params.shared_weights:
+                model_dir = shared_model_path(model_dir)
+                if not os.path.exists(model_dir):
+                    raise FileNotFoundError(
+                        "{} not found, run shared_weights.py to generate it".format(model_dir)
+                    )
+            setattr(params, stage + "_model_dir", model_dir)
+
         # 初始化模型
         super().__init__(params)
-
-    def ocr(self, img, det=True, rec=True, cls=True):
-        if cls == True and self.use_angle_cls == False:
+        self.quality_gate = QualityGate(params)
+
+    def triage(self, img, det=True):
+        """
+        快速质量检查：模糊、曝光、反光和（det 为 True 时）缩小图上的文字面积，
+        不做识别，用于在完整识别前拒绝不合格的图片
+        return: {"accept", "reasons", "metrics", "elapsed_ms"}
+        """
+        with self.checkout_sessions():
+            return self.quality_gate(img, self.text_detector if det else None)
+
+    def ocr(self, img, det=True, rec=True, cls=True, stats=None, deadline_ms=None, refine_source=None):
+        """
+        stats: 可选的 dict，返回本次识别的统计信息
+        deadline_ms: 时间预算（毫秒），超时返回部分结果并在 stats["partial"] 中标记
+        refine_source: img 为缩小解码的图片时，低置信度行二次识别用的高分辨率原图
+            (图片, (x缩放, y缩放)) 或返回它的函数，见 TextSystem.__call__
+        """
+        if cls == True and self.use_angle_cls == False and not self.use_page_orientation:
             print(
                 "Since the angle classifier is not initialized, the angle classifier will not be uesd during the forward process"
             )
 
         if det and rec:
             ocr_res = []
-            dt_boxes, rec_res = self.__call__(img, cls)
+            dt_boxes, rec_res = self.__call__(
+                img, cls, stats=stats, deadline_ms=deadline_ms, refine_source=refine_source
+            )
             tmp_res = [[box.tolist(), res] for box, res in zip(dt_boxes, rec_res)]
             ocr_res.append(tmp_res)
             return ocr_res
@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+
+class PageDeskew(object):
+    """
+    整页倾斜校正：由检测框上下边的角度估计一次整页倾斜角，把整页旋转摆正，
+    之后大部分文本框接近水平，裁剪时直接切片，不再逐框做透视变换。
+
+    只用长宽比足够大的横向框，按框宽加权取中位数；大部分框与中位数一致时才认为估计可信。
+    角度小于 min_angle（无需校正）、大于 max_angle（更可能是版面本身的斜排文字）
+    或不可信时返回 None。
+    """
+
+    def __init__(self, args):
+        self.min_angle = args.deskew_min_angle
+        self.max_angle = args.deskew_max_angle
+        self.min_boxes = 3
+        self.min_elongation = 2.0
+        # 与中位数相差不超过 agree_deg 度的框占比（按宽度加权）
+        self.agree_deg = 1.0
+        self.min_agreement = 0.6
+
+    def estimate(self, dt_boxes):
+        """
+        return: (倾斜角, 一致率)，倾斜角为文字行相对水平方向顺时针倾斜的度数；
+            无法估计时倾斜角为 None
+        """
+        boxes = np.asarray(dt_boxes, dtype=np.float32).reshape(-1, 4, 2)
+        top = boxes[:, 1] - boxes[:, 0]
+        bottom = boxes[:, 2] - boxes[:, 3]
+        widths = (np.linalg.norm(top, axis=1) + np.linalg.norm(bottom, axis=1)) / 2
+        heights = np.linalg.norm(boxes[:, 3] - boxes[:, 0], axis=1)
+        horizontal = (widths >= self.min_elongation * np.maximum(heights, 1.0)) & (
+            np.abs(top[:, 0]) > np.abs(top[:, 1])
+        )
+        if np.count_nonzero(horizontal) < self.min_boxes:
+            return None, 0.0
+        angles = np.degrees(
+            (np.arctan2(top[:, 1], top[:, 0]) + np.arctan2(bottom[:, 1], bottom[:, 0])) / 2
+        )[horizontal]
+        weights = widths[horizontal]
+        order = np.argsort(angles)
+        cum = np.cumsum(weights[order])
+        angle = float(angles[order][np.searchsorted(cum, cum[-1] / 2)])
+        agreement = float(weights[np.abs(angles - angle) <= self.agree_deg].sum() / weights.sum())
+        if agreement < self.min_agreement or abs(angle) > self.max_angle:
+            return None, agreement
+        if abs(angle) < self.min_angle:
+            return None, agreement
+        return angle, agreement
+
+    @staticmethod
+    def rotation(angle, img_shape):
+        """
+        旋转 angle 度（逆时针，抵消顺时针倾斜）的仿射矩阵，画布扩大到容纳整页
+        return: (矩阵, (宽, 高))
+        """
+        h, w = img_shape[0:2]
+        M = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+        cos, sin = abs(M[0, 0]), abs(M[0, 1])
+        new_w = int(np.ceil(w * cos + h * sin))
+        new_h = int(np.ceil(w * sin + h * cos))
+        M[0, 2] += (new_w - w) / 2.0
+        M[1, 2] += (new_h - h) / 2.0
+        return M, (new_w, new_h)
+
+    @staticmethod
+    def rotate_image(img, M, size):
+        return cv2.warpAffine(
+            img, M, size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE
+        )
+
+    @staticmethod
+    def transform_boxes(boxes, M):
+        """对 (N, 4, 2) 的框坐标做仿射变换"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        return (boxes @ M[:, :2].T.astype(np.float32) + M[:, 2].astype(np.float32)).astype(np.float32)
+
+    @classmethod
+    def unrotate_boxes(cls, boxes, M):
+        """摆正后图片上的框映射回原图"""
+        return cls.transform_boxes(boxes, cv2.invertAffineTransform(M))
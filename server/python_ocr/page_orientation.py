@@ -0,0 +1,88 @@
+import numpy as np
+
+from utils import get_rotate_crop_image
+
+
+class PageOrientation(object):
+    """
+    整页方向估计（0/90/180/270，顺时针旋转多少度后页面为正）。
+
+    先用检测框的几何形状判断文字行是横向还是竖向（区分 0/180 与 90/270），
+    再对少量采样文本行调用 TextClassifier 判断是否倒置。每页只估计一次，
+    置信度不足时返回 None，调用方回退到逐行方向分类。
+    """
+
+    def __init__(self, args, text_classifier):
+        self.text_classifier = text_classifier
+        self.sample_num = args.page_ori_sample_num
+        self.thresh = args.page_ori_thresh
+        # 长宽比超过该值的框才参与投票，接近正方形的框无法判断方向
+        self.min_elongation = 1.5
+
+    def box_sides(self, dt_boxes):
+        widths = np.linalg.norm(dt_boxes[:, 0] - dt_boxes[:, 1], axis=1)
+        heights = np.linalg.norm(dt_boxes[:, 0] - dt_boxes[:, 3], axis=1)
+        return widths, heights
+
+    def estimate_axis(self, dt_boxes):
+        """
+        根据检测框几何判断文字方向轴。
+        return: (base_angle, confidence, candidate_indices)，base_angle 为 0 或 90，
+            candidate_indices 为与该方向一致的框，按面积从大到小排列
+        """
+        widths, heights = self.box_sides(dt_boxes)
+        long_side = np.maximum(widths, heights)
+        short_side = np.maximum(np.minimum(widths, heights), 1.0)
+        elongated = long_side / short_side >= self.min_elongation
+        if not np.any(elongated):
+            return None, 0.0, None
+        area = widths * heights
+        vertical = heights > widths
+        vertical_area = area[elongated & vertical].sum()
+        horizontal_area = area[elongated & ~vertical].sum()
+        if vertical_area > horizontal_area:
+            base_angle, agree = 90, elongated & vertical
+        else:
+            base_angle, agree = 0, elongated & ~vertical
+        confidence = max(vertical_area, horizontal_area) / (
+            vertical_area + horizontal_area
+        )
+        candidates = np.nonzero(agree)[0]
+        candidates = candidates[np.argsort(-area[candidates], kind="stable")]
+        return base_angle, float(confidence), candidates
+
+    def __call__(self, img, dt_boxes):
+        """
+        img: 原图
+        dt_boxes: 检测框，形状 (N, 4, 2)，点序为顺时针、从左上角开始
+        return: (angle, confidence)，angle 为 None 时表示无法可靠判断
+        """
+        if dt_boxes is None or len(dt_boxes) == 0:
+            return None, 0.0
+        dt_boxes = np.asarray(dt_boxes, dtype=np.float32)
+        base_angle, axis_conf, candidates = self.estimate_axis(dt_boxes)
+        if base_angle is None:
+            return None, 0.0
+
+        # 旋转点序即可得到按候选方向摆正的文本行，无需旋转整张图
+        shift = base_angle // 90
+        sample_crops = [
+            get_rotate_crop_image(img, np.roll(dt_boxes[i], shift, axis=0))
+            for i in candidates[: self.sample_num]
+        ]
+        _, cls_res = self.text_classifier(sample_crops)
+
+        votes = {base_angle: 0.0, base_angle + 180: 0.0}
+        for label, score in cls_res:
+            if "180" in label:
+                votes[base_angle + 180] += float(score)
+            else:
+                votes[base_angle] += float(score)
+        total = sum(votes.values())
+        if total <= 0:
+            return None, 0.0
+        angle = max(votes, key=votes.get)
+        confidence = axis_conf * votes[angle] / total
+        if confidence < self.thresh:
+            return None, confidence
+        return angle, confidence
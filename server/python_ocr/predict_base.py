@@ -1,20 +1,102 @@
+import os
+import queue
+import threading
+
 import onnxruntime
 
+from shared_weights import SharedWeights
+
+
+class SessionPool(object):
+    """
+    同一模型的多个 InferenceSession，对外接口与 InferenceSession 相同。
+    run 时借出一个空闲会话，用完归还，N 个会话时 N 个并发调用真正并行，全部借出时等待；
+    线程也可以用 pin()/unpin() 在一段时间内独占一个会话（见 TextSystem.checkout_sessions）。
+    """
+
+    def __init__(self, sessions):
+        self.sessions = list(sessions)
+        self._free = queue.Queue()
+        for session in self.sessions:
+            self._free.put(session)
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def pin(self):
+        """当前线程独占一个会话，可重入"""
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.session = self._free.get()
+        self._local.depth = depth + 1
+
+    def unpin(self):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            session, self._local.session = self._local.session, None
+            self._free.put(session)
+
+    def run(self, *args, **kwargs):
+        if getattr(self._local, "depth", 0) > 0:
+            return self._local.session.run(*args, **kwargs)
+        session = self._free.get()
+        try:
+            return session.run(*args, **kwargs)
+        finally:
+            self._free.put(session)
+
+    def get_inputs(self):
+        return self.sessions[0].get_inputs()
+
+    def get_outputs(self):
+        return self.sessions[0].get_outputs()
+
+    def get_providers(self):
+        return self.sessions[0].get_providers()
+
+
 class PredictBase(object):
     def __init__(self):
         pass
 
-    def get_onnx_session(self, model_dir, use_gpu):
+    def get_onnx_session(self, model_dir, use_gpu, intra_op_num_threads=0, pool_size=1, allow_spinning=True, shared_weights=False, shared_prepack=False):
+        """
+        pool_size > 1 时返回含 pool_size 个会话的 SessionPool；
+        未指定 intra_op_num_threads 时各会话平分CPU核数
+        allow_spinning: 为 False 时线程池空闲不自旋，inter-op 线程数设为 1
+        shared_weights: model_dir 为 shared_weights.py 生成的模型，权重内存映射后直接使用，
+            会话池中的各会话共用同一份权重
+        shared_prepack: 共享权重时是否保留预打包（见 SharedWeights.apply）
+        """
         # 使用gpu
         if use_gpu:
             providers =[('CUDAExecutionProvider',{"cudnn_conv_algo_search": "DEFAULT"}),'CPUExecutionProvider']
         else:
             providers =['CPUExecutionProvider']
 
-        onnx_session = onnxruntime.InferenceSession(model_dir, None,providers=providers)
+        pool_size = max(pool_size, 1)
+        if intra_op_num_threads <= 0 and pool_size > 1:
+            intra_op_num_threads = max(1, (os.cpu_count() or 1) // pool_size)
+        sess_options = None
+        if intra_op_num_threads > 0 or not allow_spinning or shared_weights:
+            sess_options = onnxruntime.SessionOptions()
+        if shared_weights:
+            SharedWeights.load(model_dir).apply(sess_options, prepack=shared_prepack)
+        if intra_op_num_threads > 0:
+            # 多进程/多模型并行时限制每个会话的线程数，避免线程池互相争抢
+            sess_options.intra_op_num_threads = intra_op_num_threads
+        if not allow_spinning:
+            sess_options.inter_op_num_threads = 1
+            sess_options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+            sess_options.add_session_config_entry("session.inter_op.allow_spinning", "0")
+        sessions = [
+            onnxruntime.InferenceSession(model_dir, sess_options,providers=providers)
+            for _ in range(pool_size)
+        ]
 
         # print("providers:", onnxruntime.get_device())
-        return onnx_session
+        return sessions[0] if pool_size == 1 else SessionPool(sessions)
 
 
     def get_output_name(self, onnx_session):
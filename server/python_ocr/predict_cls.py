@@ -1,7 +1,7 @@
 import cv2
-import copy
 import numpy as np
 import math
+import threading
 
 from cls_postprocess import ClsPostProcess
 from predict_base import PredictBase
@@ -12,15 +12,54 @@ class TextClassifier(PredictBase):
         self.cls_image_shape = [int(v) for v in args.cls_image_shape.split(",")]
         self.cls_batch_num = args.cls_batch_num
         self.cls_thresh = args.cls_thresh
+        self.cls_use_thumbnail = getattr(args, "cls_use_thumbnail", False)
         self.postprocess_op = ClsPostProcess(label_list=args.label_list)
 
         # 初始化模型
-        self.cls_onnx_session = self.get_onnx_session(args.cls_model_dir, args.use_gpu)
+        self.cls_onnx_session = self.get_onnx_session(
+            args.cls_model_dir,
+            args.use_gpu,
+            args.intra_op_num_threads,
+            args.session_pool_size,
+            args.ort_allow_spinning,
+            args.shared_weights,
+            args.shared_weights_prepack,
+        )
         self.cls_input_name = self.get_input_name(self.cls_onnx_session)
         self.cls_output_name = self.get_output_name(self.cls_onnx_session)
 
-    def resize_norm_img(self, img):
+        # 预分配的输入张量，按需扩容，多次调用之间复用（每个线程一份）
+        self._local = threading.local()
+
+    def get_thumbnail(self, img):
+        """
+        方向判断不需要原始分辨率：按整数步长抽样得到缩略图（视图，不复制数据），
+        步长取高度方向的缩放倍数，抽样后的高度不低于模型输入高度
+        """
+        imgH = self.cls_image_shape[1]
+        step = max(1, img.shape[0] // imgH)
+        if step < 2:
+            return img
+        return img[::step, ::step]
+
+    def get_norm_buffer(self, batch_size):
+        imgC, imgH, imgW = self.cls_image_shape
+        buffer = getattr(self._local, "norm_buffer", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = np.empty((batch_size, imgC, imgH, imgW), dtype=np.float32)
+            self._local.norm_buffer = buffer
+        return buffer[:batch_size]
+
+    def resize_norm_img(self, img, out=None):
+        """
+        缩放并归一化到 [-1, 1]，直接写入 out（形状为 cls_image_shape）中，
+        右侧补零。不修改输入图像
+        """
         imgC, imgH, imgW = self.cls_image_shape
+        if out is None:
+            out = np.empty((imgC, imgH, imgW), dtype=np.float32)
+        if self.cls_use_thumbnail:
+            img = self.get_thumbnail(img)
         h = img.shape[0]
         w = img.shape[1]
         ratio = w / float(h)
@@ -29,47 +68,39 @@ class TextClassifier(PredictBase):
         else:
             resized_w = int(math.ceil(imgH * ratio))
         resized_image = cv2.resize(img, (resized_w, imgH))
-        resized_image = resized_image.astype("float32")
-        if self.cls_image_shape[0] == 1:
-            resized_image = resized_image / 255
+        if imgC == 1:
+            if resized_image.ndim == 3:
+                resized_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2GRAY)
             resized_image = resized_image[np.newaxis, :]
         else:
-            resized_image = resized_image.transpose((2, 0, 1)) / 255
-        resized_image -= 0.5
-        resized_image /= 0.5
-        padding_im = np.zeros((imgC, imgH, imgW), dtype=np.float32)
-        padding_im[:, :, 0:resized_w] = resized_image
-        return padding_im
+            resized_image = resized_image.transpose((2, 0, 1))
+        # (x / 255 - 0.5) / 0.5 == x / 127.5 - 1
+        valid = out[:, :, 0:resized_w]
+        np.multiply(resized_image, np.float32(1.0 / 127.5), out=valid, casting="unsafe")
+        valid -= 1.0
+        out[:, :, resized_w:] = 0.0
+        return out
 
     def __call__(self, img_list):
-        img_list = copy.deepcopy(img_list)
+        """
+        对文本行图像做 0/180 度分类。输入列表及其中的图像都不会被修改：
+        返回一个新列表，需要旋转的行替换为旋转后的副本，其余元素原样引用
+        """
+        img_list = list(img_list)
         img_num = len(img_list)
-        # Calculate the aspect ratio of all text bars
-        width_list = []
-        for img in img_list:
-            width_list.append(img.shape[1] / float(img.shape[0]))
-        # Sorting can speed up the cls process
-        indices = np.argsort(np.array(width_list))
-
+        # 输入固定为 cls_image_shape，按宽高比排序不能减少补零，按原顺序分批
         cls_res = [["", 0.0]] * img_num
-        batch_num = self.cls_batch_num
+        # cls_batch_num <= 0 时整页（整次调用）一个批次
+        batch_num = self.cls_batch_num if self.cls_batch_num > 0 else max(img_num, 1)
 
         for beg_img_no in range(0, img_num, batch_num):
 
             end_img_no = min(img_num, beg_img_no + batch_num)
-            norm_img_batch = []
-            max_wh_ratio = 0
-
+            norm_img_batch = self.get_norm_buffer(end_img_no - beg_img_no)
             for ino in range(beg_img_no, end_img_no):
-                h, w = img_list[indices[ino]].shape[0:2]
-                wh_ratio = w * 1.0 / h
-                max_wh_ratio = max(max_wh_ratio, wh_ratio)
-            for ino in range(beg_img_no, end_img_no):
-                norm_img = self.resize_norm_img(img_list[indices[ino]])
-                norm_img = norm_img[np.newaxis, :]
-                norm_img_batch.append(norm_img)
-            norm_img_batch = np.concatenate(norm_img_batch)
-            norm_img_batch = norm_img_batch.copy()
+                self.resize_norm_img(
+                    img_list[ino], out=norm_img_batch[ino - beg_img_no]
+                )
 
             input_feed = self.get_input_feed(self.cls_input_name, norm_img_batch)
             outputs = self.cls_onnx_session.run(
@@ -81,9 +112,25 @@ class TextClassifier(PredictBase):
             cls_result = self.postprocess_op(prob_out)
             for rno in range(len(cls_result)):
                 label, score = cls_result[rno]
-                cls_res[indices[beg_img_no + rno]] = [label, score]
+                cls_res[beg_img_no + rno] = [label, score]
                 if "180" in label and score > self.cls_thresh:
-                    img_list[indices[beg_img_no + rno]] = cv2.rotate(
-                        img_list[indices[beg_img_no + rno]], 1
+                    img_list[beg_img_no + rno] = cv2.rotate(
+                        img_list[beg_img_no + rno], cv2.ROTATE_180
                     )
         return img_list, cls_res
+
+    def classify_pages(self, pages):
+        """
+        多页一次分类：pages 为每页的文本行图像列表，
+        所有行合并成一次调用以充分利用批处理，结果按页拆回
+        """
+        flat = [img for page in pages for img in page]
+        flat, flat_res = self(flat)
+        img_pages, res_pages = [], []
+        beg = 0
+        for page in pages:
+            end = beg + len(page)
+            img_pages.append(flat[beg:end])
+            res_pages.append(flat_res[beg:end])
+            beg = end
+        return img_pages, res_pages
@@ -1,6 +1,7 @@
 import numpy as np
 from imaug import transform, create_operators
 from db_postprocess import DBPostProcess
+from operators import DetResizeForTest
 from predict_base import PredictBase
 
 
@@ -43,7 +44,15 @@ class TextDetector(PredictBase):
         self.postprocess_op = DBPostProcess(**postprocess_params)
 
         # 初始化模型
-        self.det_onnx_session = self.get_onnx_session(args.det_model_dir, args.use_gpu)
+        self.det_onnx_session = self.get_onnx_session(
+            args.det_model_dir,
+            args.use_gpu,
+            args.intra_op_num_threads,
+            args.session_pool_size,
+            args.ort_allow_spinning,
+            args.shared_weights,
+            args.shared_weights_prepack,
+        )
         self.det_input_name = self.get_input_name(self.det_onnx_session)
         self.det_output_name = self.get_output_name(self.det_onnx_session)
 
@@ -64,10 +73,11 @@ class TextDetector(PredictBase):
             points[pno, 1] = int(min(max(points[pno, 1], 0), img_height - 1))
         return points
 
-    def filter_tag_det_res(self, dt_boxes, image_shape):
+    def filter_tag_det_res(self, dt_boxes, image_shape, dt_scores=None):
         img_height, img_width = image_shape[0:2]
         dt_boxes_new = []
-        for box in dt_boxes:
+        dt_scores_new = []
+        for bno, box in enumerate(dt_boxes):
             if type(box) is list:
                 box = np.array(box)
             box = self.order_points_clockwise(box)
@@ -77,7 +87,11 @@ class TextDetector(PredictBase):
             if rect_width <= 3 or rect_height <= 3:
                 continue
             dt_boxes_new.append(box)
+            if dt_scores is not None:
+                dt_scores_new.append(dt_scores[bno])
         dt_boxes = np.array(dt_boxes_new)
+        if dt_scores is not None:
+            return dt_boxes, np.array(dt_scores_new, dtype=np.float32)
         return dt_boxes
 
     def filter_tag_det_res_only_clip(self, dt_boxes, image_shape):
@@ -91,11 +105,22 @@ class TextDetector(PredictBase):
         dt_boxes = np.array(dt_boxes_new)
         return dt_boxes
 
-    def __call__(self, img):
+    def __call__(self, img, return_scores=False, limit_side_len=None):
+        """
+        return_scores 为 True 时同时返回每个框的检测得分 (dt_boxes, dt_scores)
+        limit_side_len: 本次调用使用的检测边长限制，默认使用 det_limit_side_len
+        """
         ori_im = img.copy()
         data = {"image": img}
 
-        data = transform(data, self.preprocess_op)
+        preprocess_op = self.preprocess_op
+        if limit_side_len is not None and limit_side_len != self.args.det_limit_side_len:
+            preprocess_op = [
+                DetResizeForTest(
+                    limit_side_len=limit_side_len, limit_type=self.args.det_limit_type
+                )
+            ] + self.preprocess_op[1:]
+        data = transform(data, preprocess_op)
         img, shape_list = data
         if img is None:
             return None, 0
@@ -111,10 +136,17 @@ class TextDetector(PredictBase):
 
         post_result = self.postprocess_op(preds, shape_list)
         dt_boxes = post_result[0]["points"]
+        dt_scores = post_result[0]["scores"]
 
         if self.args.det_box_type == "poly":
+            # 只裁剪坐标，不丢弃框，得分顺序不变
             dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_im.shape)
+            dt_scores = np.array(dt_scores, dtype=np.float32)
         else:
-            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+            dt_boxes, dt_scores = self.filter_tag_det_res(
+                dt_boxes, ori_im.shape, dt_scores
+            )
 
+        if return_scores:
+            return dt_boxes, dt_scores
         return dt_boxes
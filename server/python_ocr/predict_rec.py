@@ -1,11 +1,14 @@
 import cv2
 import numpy as np
 import math
+import threading
+import time
 from PIL import Image
 
 
 from rec_postprocess import CTCLabelDecode
 from predict_base import PredictBase
+from rec_cache import RecCache
 
 
 class TextRecognizer(PredictBase):
@@ -13,15 +16,53 @@ class TextRecognizer(PredictBase):
         self.rec_image_shape = [int(v) for v in args.rec_image_shape.split(",")]
         self.rec_batch_num = args.rec_batch_num
         self.rec_algorithm = args.rec_algorithm
+        self.rec_return_char_info = args.rec_return_char_info
         self.postprocess_op = CTCLabelDecode(
             character_dict_path=args.rec_char_dict_path,
             use_space_char=args.use_space_char,
         )
 
         # 初始化模型
-        self.rec_onnx_session = self.get_onnx_session(args.rec_model_dir, args.use_gpu)
+        self.rec_onnx_session = self.get_onnx_session(
+            args.rec_model_dir,
+            args.use_gpu,
+            args.intra_op_num_threads,
+            args.session_pool_size,
+            args.ort_allow_spinning,
+            args.shared_weights,
+            args.shared_weights_prepack,
+        )
         self.rec_input_name = self.get_input_name(self.rec_onnx_session)
         self.rec_output_name = self.get_output_name(self.rec_onnx_session)
+        # 两级识别：rec_model_dir（小模型或量化模型）识别全部行，置信度低于
+        # rec_cascade_thresh 的行再用 rec_cascade_model_dir 的大模型识别，
+        # 两级共用同一份字典和预处理后的输入张量
+        self.cascade_session = None
+        self.cascade_thresh = args.rec_cascade_thresh
+        if args.rec_cascade_model_dir:
+            self.cascade_session = self.get_onnx_session(
+                args.rec_cascade_model_dir,
+                args.use_gpu,
+                args.intra_op_num_threads,
+                args.session_pool_size,
+                args.ort_allow_spinning,
+                args.shared_weights,
+                args.shared_weights_prepack,
+            )
+            self.cascade_input_name = self.get_input_name(self.cascade_session)
+            self.cascade_output_name = self.get_output_name(self.cascade_session)
+        self._cascade_lock = threading.Lock()
+        self.cascade_lines = 0
+        self.cascade_escalated = 0
+        self.cascade_improved = 0
+        # 跨调用的识别结果缓存，多个线程共用
+        self.cache = None
+        if args.rec_cache_size > 0:
+            self.cache = RecCache(
+                capacity=args.rec_cache_size,
+                min_score=args.rec_cache_min_score,
+                tol=args.rec_cache_tol,
+            )
 
     def resize_norm_img(self, img, max_wh_ratio):
         imgC, imgH, imgW = self.rec_image_shape
@@ -277,7 +318,61 @@ class TextRecognizer(PredictBase):
 
         return img
 
-    def __call__(self, img_list):
+    def __call__(self, img_list, cascade=True, timing=None):
+        """
+        识别文本行；启用缓存时只有未命中的行送入模型
+        cascade: 为 False 时不走第二级识别（预算不足时），这样的结果不写入缓存
+        timing: 可选的 dict，累加第二级识别的耗时 cascade_ms
+        """
+        if self.cache is None:
+            return self.recognize(img_list, cascade, timing)
+        keys = [self.cache.thumbnail(img) for img in img_list]
+        rec_res = [self.cache.get(key, thumb) for key, thumb in keys]
+        missing = [i for i, res in enumerate(rec_res) if res is None]
+        if missing:
+            cacheable = cascade or self.cascade_session is None
+            for i, res in zip(missing, self.recognize([img_list[i] for i in missing], cascade, timing)):
+                rec_res[i] = res
+                if cacheable:
+                    self.cache.put(keys[i][0], keys[i][1], res)
+        return rec_res
+
+    def escalate(self, norm_img_batch, rec_result, timing=None):
+        """第一级置信度低的行送入第二级模型，直接复用第一级的输入张量，保留置信度更高的结果"""
+        hard = [i for i, res in enumerate(rec_result) if res[1] < self.cascade_thresh]
+        improved = 0
+        if hard:
+            t0 = time.time()
+            input_feed = self.get_input_feed(self.cascade_input_name, norm_img_batch[hard])
+            outputs = self.cascade_session.run(self.cascade_output_name, input_feed=input_feed)
+            hard_result = self.postprocess_op(
+                outputs[0], return_char_info=self.rec_return_char_info
+            )
+            for i, res in zip(hard, hard_result):
+                if res[1] > rec_result[i][1]:
+                    rec_result[i] = res
+                    improved += 1
+            if timing is not None:
+                timing["cascade_ms"] = timing.get("cascade_ms", 0.0) + (time.time() - t0) * 1000
+        with self._cascade_lock:
+            self.cascade_lines += len(rec_result)
+            self.cascade_escalated += len(hard)
+            self.cascade_improved += improved
+        return rec_result
+
+    def cascade_stats(self):
+        """两级识别的累计统计：识别行数、送入第二级的行数及占比、第二级置信度更高的行数"""
+        with self._cascade_lock:
+            return {
+                "lines": self.cascade_lines,
+                "escalated": self.cascade_escalated,
+                "escalated_rate": self.cascade_escalated / float(self.cascade_lines)
+                if self.cascade_lines
+                else 0.0,
+                "improved": self.cascade_improved,
+            }
+
+    def recognize(self, img_list, cascade=True, timing=None):
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
@@ -319,7 +414,11 @@ class TextRecognizer(PredictBase):
 
             preds = outputs[0]
 
-            rec_result = self.postprocess_op(preds)
+            rec_result = self.postprocess_op(
+                preds, return_char_info=self.rec_return_char_info
+            )
+            if cascade and self.cascade_session is not None:
+                rec_result = self.escalate(norm_img_batch, rec_result, timing)
             for rno in range(len(rec_result)):
                 rec_res[indices[beg_img_no + rno]] = rec_result[rno]
 
@@ -1,73 +1,465 @@
 import os
 import cv2
 import copy
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
 import predict_det
 import predict_cls
 import predict_rec
-from utils import get_rotate_crop_image, get_minarea_rect_crop
+from async_writer import AsyncWriter
+from box_filter import BoxFilter
+from cpu_budget import apply_cpu_budget
+from predict_base import SessionPool
+from latency_budget import LatencyBudget, StageCostModel, det_input_mpix
+from line_refine import LineRefiner
+from page_deskew import PageDeskew
+from page_orientation import PageOrientation
+from reading_order import ReadingOrder, remap_layout
+from utils import get_rotate_crop_image, get_minarea_rect_crop, axis_aligned_rect
+from utils import rotate_image, rotate_boxes, unrotate_boxes
 
 
 class TextSystem(object):
+    """
+    检测 + 方向分类 + 识别的完整流程。
+
+    线程安全且可重入：调用过程中的中间结果都是局部变量，共享的只有只读配置、
+    加锁的耗时模型和各线程独立的预处理缓冲区，多个线程可以同时调用同一个实例。
+    session_pool_size 为 1 时所有线程共用一组 onnxruntime 会话（ORT 的 run 本身线程安全，
+    但并发调用会争抢同一个线程池）；大于 1 时每次调用借出一组独立的 det/cls/rec 会话，
+    最多 session_pool_size 个调用真正并行，其余等待空闲会话。
+    """
+
     def __init__(self, args):
+        # CPU 预算需在创建 onnxruntime 会话之前设置
+        self.cpu_budget = apply_cpu_budget(args)
         self.text_detector = predict_det.TextDetector(args)
         self.text_recognizer = predict_rec.TextRecognizer(args)
         self.use_angle_cls = args.use_angle_cls
         self.drop_score = args.drop_score
-        if self.use_angle_cls:
+        self.use_page_orientation = args.use_page_orientation
+        self.use_lazy_cls = args.use_lazy_cls
+        self.lazy_cls_thresh = args.lazy_cls_thresh
+        if self.use_angle_cls or self.use_page_orientation:
             self.text_classifier = predict_cls.TextClassifier(args)
+        if self.use_page_orientation:
+            self.page_orientation = PageOrientation(args, self.text_classifier)
+        self.deskew = PageDeskew(args) if args.use_deskew else None
+        self.refiner = (
+            LineRefiner(args, self.text_recognizer.rec_image_shape[1]) if args.use_refine else None
+        )
+
+        self.box_filter = BoxFilter(args)
+        # 各阶段耗时估计，每次调用后更新，供 deadline_ms 模式做决策
+        self.cost_model = StageCostModel()
+        self.reading_order = ReadingOrder(
+            line_tol=args.line_y_tol, use_columns=args.use_column_order
+        )
 
         self.args = args
         self.crop_image_res_index = 0
+        self._crop_index_lock = threading.Lock()
+        # 裁剪图在后台线程中编码写盘，不占用识别调用的时间
+        self.crop_writer = AsyncWriter(max_workers=1)
+        self.session_pools = [
+            session
+            for session in (
+                self.text_detector.det_onnx_session,
+                getattr(self, "text_classifier", None) and self.text_classifier.cls_onnx_session,
+                self.text_recognizer.rec_onnx_session,
+                self.text_recognizer.cascade_session,
+            )
+            if isinstance(session, SessionPool)
+        ]
 
     def draw_crop_rec_res(self, output_dir, img_crop_list, rec_res):
         os.makedirs(output_dir, exist_ok=True)
         bbox_num = len(img_crop_list)
+        # 并发调用时各自占用一段连续的编号
+        with self._crop_index_lock:
+            start_index = self.crop_image_res_index
+            self.crop_image_res_index += bbox_num
         for bno in range(bbox_num):
-            cv2.imwrite(
+            self.crop_writer.write_image(
                 os.path.join(
-                    output_dir, f"mg_crop_{bno+self.crop_image_res_index}.jpg"
+                    output_dir, f"mg_crop_{bno+start_index}.jpg"
                 ),
                 img_crop_list[bno],
             )
 
-        self.crop_image_res_index += bbox_num
+    def flush(self, raise_errors=True):
+        """等待已提交的裁剪图写完；有写入失败时抛出第一个异常"""
+        self.crop_writer.flush(raise_errors)
+
+    def close(self):
+        self.crop_writer.close()
+
+    def lazy_angle_cls(self, img_crop_list, rec_res, stats=None, budget=None):
+        """
+        先识别、后分类：识别置信度低于 lazy_cls_thresh 的行才送入方向分类器，
+        判定为 180 度的行旋转后重新识别，保留两次中置信度更高的结果；
+        预算不足以分类或重新识别时跳过
+        return: (裁剪图, 识别结果, 裁剪图已旋转 180 度的行下标)
+        """
+        img_crop_list = list(img_crop_list)
+        rec_res = list(rec_res)
+        doubtful = [
+            i for i, res in enumerate(rec_res) if res[1] < self.lazy_cls_thresh
+        ]
+        if doubtful and budget is not None and not budget.can_afford("cls", len(doubtful)):
+            budget.degraded.append("skip_lazy_cls")
+            doubtful = []
+        flipped = []
+        if doubtful:
+            t0 = time.time()
+            _, cls_res = self.text_classifier([img_crop_list[i] for i in doubtful])
+            self.cost_model.update("cls", (time.time() - t0) * 1000, len(doubtful))
+            for i, (label, score) in zip(doubtful, cls_res):
+                if "180" in label and score > self.text_classifier.cls_thresh:
+                    flipped.append(i)
+        if flipped and budget is not None and not budget.can_afford("rec", len(flipped)):
+            budget.degraded.append("skip_lazy_cls")
+            flipped = []
+        improved = []
+        if flipped:
+            rotated = [cv2.rotate(img_crop_list[i], cv2.ROTATE_180) for i in flipped]
+            re_res = self.recognize_lines(rotated, budget)
+            for i, img_crop, new_res in zip(flipped, rotated, re_res):
+                if new_res[1] > rec_res[i][1]:
+                    img_crop_list[i] = img_crop
+                    rec_res[i] = new_res
+                    improved.append(i)
+        if stats is not None:
+            stats["lazy_cls_checked"] = len(doubtful)
+            stats["lazy_cls_rerecognized"] = len(flipped)
+            stats["lazy_cls_improved"] = len(improved)
+        return img_crop_list, rec_res, improved
 
-    def __call__(self, img, cls=True):
+    def refine_low_confidence(
+        self, ori_im, dt_boxes, img_crop_list, rec_res, flipped=(), budget=None, stats=None, source=None, to_input=None
+    ):
+        """
+        置信度低于 refine_thresh 的行带余量重新裁剪，作为一个额外批次识别，
+        保留置信度更高的结果；flipped 为方向分类时已旋转 180 度的行
+        source: 高分辨率原图 (图片, (x缩放, y缩放))，或返回它的函数（有需要二次识别的行时才调用），
+            输入图坐标乘以缩放得到原图坐标；to_input 把工作图（整页旋转、倾斜校正后）上的框
+            映射回输入图坐标。为 None 时从工作图 ori_im 裁剪
+        """
+        doubtful = self.refiner.select(rec_res)
+        if not doubtful:
+            return img_crop_list, rec_res
+        if budget is not None and not budget.can_afford("rec", len(doubtful)):
+            budget.degraded.append("skip_refine")
+            return img_crop_list, rec_res
+        img_crop_list = list(img_crop_list)
+        rec_res = list(rec_res)
+        if callable(source):
+            source = source()
+        if source is not None and source[0] is not None and self.args.det_box_type == "quad":
+            # 映射时保持四个点的顺序，透视变换裁剪出的文字方向与工作图上相同
+            src_img, (sx, sy) = source
+            boxes = to_input([dt_boxes[i] for i in doubtful]) * np.float32([sx, sy])
+            crops = [self.refiner.crop(src_img, box) for box in boxes]
+        else:
+            source = None
+            crops = [self.refiner.crop(ori_im, dt_boxes[i]) for i in doubtful]
+        crops = [
+            cv2.rotate(img_crop, cv2.ROTATE_180) if i in flipped else img_crop
+            for i, img_crop in zip(doubtful, crops)
+        ]
+        t0 = time.time()
+        new_res = self.recognize_lines(crops, budget)
+        elapsed = (time.time() - t0) * 1000
+        improved, recovered = 0, 0
+        for i, img_crop, res in zip(doubtful, crops, new_res):
+            if res[1] > rec_res[i][1]:
+                if rec_res[i][1] < self.drop_score <= res[1]:
+                    recovered += 1
+                img_crop_list[i] = img_crop
+                rec_res[i] = res
+                improved += 1
+        if stats is not None:
+            # recovered: 原本会因低于 drop_score 被丢弃、二次识别后保留的行
+            stats["refine"] = {
+                "lines": len(doubtful),
+                "improved": improved,
+                "recovered": recovered,
+                "rec_ms": elapsed,
+                "full_res": source is not None,
+            }
+        return img_crop_list, rec_res
+
+    def recognize_lines(self, img_list, budget=None):
+        """
+        识别文本行并更新耗时模型。启用两级识别时，剩余预算不足以覆盖第二级的预计耗时
+        则只用第一级识别，在 budget.degraded 中记录 skip_cascade
+        """
+        cascade = self.text_recognizer.cascade_session is not None
+        if cascade and budget is not None and not budget.can_afford(
+            "rec", len(img_list), self.cost_model.estimate("rec_cascade", len(img_list))
+        ):
+            cascade = False
+            if "skip_cascade" not in budget.degraded:
+                budget.degraded.append("skip_cascade")
+        timing = {}
+        t0 = time.time()
+        rec_res = self.text_recognizer(img_list, cascade=cascade, timing=timing)
+        cascade_ms = timing.get("cascade_ms", 0.0)
+        self.cost_model.update("rec", (time.time() - t0) * 1000 - cascade_ms, len(img_list))
+        if cascade:
+            self.cost_model.update("rec_cascade", cascade_ms, len(img_list))
+        return rec_res
+
+    def recognize_within_budget(self, img_crop_list, budget):
+        """
+        预算不足以识别全部文本行时，按面积从大到小分小批识别，
+        每批之前检查剩余时间，超时即停止；未识别的行返回 ("", 0.0)
+        """
+        rec_res = [("", 0.0)] * len(img_crop_list)
+        order = sorted(
+            range(len(img_crop_list)),
+            key=lambda i: -img_crop_list[i].shape[0] * img_crop_list[i].shape[1],
+        )
+        batch_num = max(1, self.text_recognizer.rec_batch_num // 2)
+        done = 0
+        for beg in range(0, len(order), batch_num):
+            chunk = order[beg : beg + batch_num]
+            if not budget.can_afford("rec", len(chunk)):
+                break
+            chunk_res = self.recognize_lines([img_crop_list[i] for i in chunk], budget)
+            for i, res in zip(chunk, chunk_res):
+                rec_res[i] = res
+            done += len(chunk)
+        return rec_res, len(img_crop_list) - done
+
+    @contextmanager
+    def checkout_sessions(self):
+        """
+        当前线程借出一组 det/cls/rec 会话，整个调用期间独占；可重入。
+        未启用会话池（session_pool_size=1）时什么也不做
+        """
+        pinned = []
+        try:
+            for pool in self.session_pools:
+                pool.pin()
+                pinned.append(pool)
+            yield
+        finally:
+            for pool in reversed(pinned):
+                pool.unpin()
+
+    def __call__(self, img, cls=True, stats=None, deadline_ms=None, refine_source=None):
+        """
+        stats: 可选的 dict，用于返回本次调用的统计信息（如页面方向）
+        deadline_ms: 时间预算（毫秒）。预算紧张时降低检测分辨率、跳过方向分类、
+            优先识别大文本框；到时仍未识别的行被丢弃，stats["partial"] 置为 True
+        refine_source: img 是缩小解码的图片时，二次识别用的高分辨率原图，
+            格式同 refine_low_confidence 的 source；设置了 deadline_ms 时不使用（重新解码的耗时不在预算内）
+        """
+        start = time.time()
+        with self.checkout_sessions():
+            return self.run_pipeline(img, cls, stats, deadline_ms, start, refine_source)
+
+    def run_pipeline(self, img, cls=True, stats=None, deadline_ms=None, start=None, refine_source=None):
+        budget = None
+        if deadline_ms is not None:
+            budget = LatencyBudget(deadline_ms, self.cost_model, start=start)
         ori_im = img.copy()
         # 文字检测
-        dt_boxes = self.text_detector(img)
+        det_side = self.args.det_limit_side_len
+        if budget is not None:
+            det_side = budget.choose_det_side(
+                img.shape, det_side, self.args.det_limit_type
+            )
+        t0 = time.time()
+        dt_boxes, dt_scores = self.text_detector(
+            img, return_scores=True, limit_side_len=det_side
+        )
+        self.cost_model.update(
+            "det",
+            (time.time() - t0) * 1000,
+            det_input_mpix(img.shape, det_side, self.args.det_limit_type),
+        )
 
         if dt_boxes is None:
             return None, None
 
+        # 识别前过滤：检测得分、文字高度、长宽比
+        filtered = 0
+        if self.box_filter.check_boxes and len(dt_boxes) > 0:
+            keep, reasons = self.box_filter.filter_boxes(dt_boxes, dt_scores)
+            dt_boxes = dt_boxes[keep]
+            filtered += len(keep) - int(keep.sum())
+            if stats is not None:
+                stats["filtered_reasons"] = reasons
+
+        # 整页方向：估计一次并旋转整页，之后跳过逐行方向分类
+        page_angle = None
+        if budget is not None and self.use_page_orientation and cls and not budget.can_afford(
+            "cls", self.page_orientation.sample_num
+        ):
+            budget.degraded.append("skip_page_orientation")
+        elif self.use_page_orientation and cls and len(dt_boxes) > 0:
+            page_angle, page_conf = self.page_orientation(ori_im, dt_boxes)
+            if stats is not None:
+                stats["page_angle"] = page_angle
+                stats["page_angle_conf"] = page_conf
+            if page_angle is not None:
+                dt_boxes = rotate_boxes(dt_boxes, page_angle, ori_im.shape)
+                ori_im = rotate_image(ori_im, page_angle)
+
+        # 整页倾斜校正：摆正后大部分框可直接切片裁剪
+        deskew_M, deskew_stats = None, None
+        oriented_shape = ori_im.shape
+        if self.deskew is not None and len(dt_boxes) > 0:
+            skew, agreement = self.deskew.estimate(dt_boxes)
+            deskew_stats = {"angle": skew or 0.0, "agreement": agreement, "applied": skew is not None}
+            if skew is not None:
+                # 校正前已经是水平框的数量，这些框本来就走切片
+                deskew_stats["aligned_before"] = sum(
+                    axis_aligned_rect(box, ori_im.shape) is not None for box in dt_boxes
+                )
+                t0 = time.time()
+                deskew_M, size = self.deskew.rotation(skew, ori_im.shape)
+                ori_im = self.deskew.rotate_image(ori_im, deskew_M, size)
+                dt_boxes = self.deskew.transform_boxes(dt_boxes, deskew_M)
+                deskew_stats["rotate_ms"] = (time.time() - t0) * 1000
+
         img_crop_list = []
 
-        dt_boxes = sorted_boxes(dt_boxes)
+        # 阅读顺序：行、段落、栏
+        layout = self.reading_order(dt_boxes)
+        dt_boxes = [dt_boxes[i] for i in layout["order"]]
+        # 排序后仍保留的位置，用于把 layout 换算到最终输出的下标
+        positions = list(range(len(dt_boxes)))
 
-        # 图片裁剪
+        # 图片裁剪；启用倾斜校正时分别统计切片和透视变换两种裁剪的耗时
+        fast_crops, fast_ms, warp_crops, warp_ms = 0, 0.0, 0, 0.0
         for bno in range(len(dt_boxes)):
             tmp_box = copy.deepcopy(dt_boxes[bno])
+            t0 = time.time()
             if self.args.det_box_type == "quad":
                 img_crop = get_rotate_crop_image(ori_im, tmp_box)
             else:
                 img_crop = get_minarea_rect_crop(ori_im, tmp_box)
             img_crop_list.append(img_crop)
+            if deskew_stats is not None:
+                if self.args.det_box_type == "quad" and axis_aligned_rect(dt_boxes[bno], ori_im.shape) is not None:
+                    fast_crops, fast_ms = fast_crops + 1, fast_ms + (time.time() - t0) * 1000
+                else:
+                    warp_crops, warp_ms = warp_crops + 1, warp_ms + (time.time() - t0) * 1000
+        if deskew_stats is not None:
+            self.cost_model.update("crop", warp_ms, warp_crops)
+            deskew_stats.update(fast_crops=fast_crops, warp_crops=warp_crops)
+            if deskew_M is not None:
+                # 因校正而改走切片的框按透视变换的平均耗时估计节省，扣除整页旋转的耗时
+                gained = max(fast_crops - deskew_stats["aligned_before"], 0)
+                deskew_stats["saved_ms"] = (
+                    self.cost_model.estimate("crop", gained) - fast_ms * gained / max(fast_crops, 1) - deskew_stats["rotate_ms"]
+                )
+            if stats is not None:
+                stats["deskew"] = deskew_stats
+
+        # 剔除空白裁剪图
+        if self.box_filter.check_crops and img_crop_list:
+            keep = [not self.box_filter.is_blank(c) for c in img_crop_list]
+            blank = keep.count(False)
+            if blank:
+                dt_boxes = [box for box, k in zip(dt_boxes, keep) if k]
+                img_crop_list = [c for c, k in zip(img_crop_list, keep) if k]
+                positions = [p for p, k in zip(positions, keep) if k]
+                filtered += blank
+            if stats is not None:
+                stats.setdefault("filtered_reasons", {})["blank"] = blank
+        if stats is not None:
+            stats["filtered_boxes"] = filtered
 
-        # 方向分类
-        if self.use_angle_cls and cls:
+        # 方向分类（整页方向已确定时跳过）
+        use_line_cls = self.use_angle_cls and cls and page_angle is None
+        crop_num = len(img_crop_list)
+        if (
+            use_line_cls
+            and budget is not None
+            and not budget.can_afford("rec", crop_num, self.cost_model.estimate("cls", crop_num))
+        ):
+            use_line_cls = False
+            budget.degraded.append("skip_cls")
+        flipped = set()
+        if use_line_cls and not self.use_lazy_cls:
+            t0 = time.time()
             img_crop_list, angle_list = self.text_classifier(img_crop_list)
+            self.cost_model.update("cls", (time.time() - t0) * 1000, crop_num)
+            flipped = {
+                i
+                for i, (label, score) in enumerate(angle_list)
+                if "180" in label and score > self.text_classifier.cls_thresh
+            }
 
         # 图像识别
-        rec_res = self.text_recognizer(img_crop_list)
+        skipped = 0
+        if budget is not None and not budget.can_afford("rec", crop_num):
+            budget.degraded.append("largest_boxes_first")
+            rec_res, skipped = self.recognize_within_budget(img_crop_list, budget)
+        else:
+            rec_res = self.recognize_lines(img_crop_list, budget)
+
+        # 延迟方向分类：只对低置信度的识别结果做方向分类和重识别（超时未识别的行不参与）
+        if use_line_cls and self.use_lazy_cls and not skipped:
+            img_crop_list, rec_res, rotated = self.lazy_angle_cls(img_crop_list, rec_res, stats, budget)
+            flipped.update(rotated)
+
+        # 低置信度的行带余量重新裁剪、二次识别（超时未识别的行不参与）
+        if self.refiner is not None and not skipped:
+
+            def to_input(boxes):
+                boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+                if deskew_M is not None:
+                    boxes = self.deskew.unrotate_boxes(boxes, deskew_M)
+                if page_angle:
+                    boxes = unrotate_boxes(boxes, page_angle, oriented_shape, roll=False)
+                return boxes
+
+            img_crop_list, rec_res = self.refine_low_confidence(
+                ori_im, dt_boxes, img_crop_list, rec_res, flipped, budget, stats,
+                refine_source if budget is None else None, to_input,
+            )
+
+        if budget is not None and stats is not None:
+            stats["deadline_ms"] = deadline_ms
+            stats["partial"] = skipped > 0
+            stats["skipped_boxes"] = skipped
+            stats["degraded"] = budget.degraded
+            stats["det_limit_side_len"] = det_side
 
         if self.args.save_crop_res:
             self.draw_crop_rec_res(self.args.crop_res_save_dir, img_crop_list, rec_res)
-        filter_boxes, filter_rec_res = [], []
-        for box, rec_result in zip(dt_boxes, rec_res):
-            text, score = rec_result
+        filter_boxes, filter_rec_res, filter_positions = [], [], []
+        for box, rec_result, position in zip(dt_boxes, rec_res, positions):
+            text, score = rec_result[:2]
             if score >= self.drop_score:
                 filter_boxes.append(box)
                 filter_rec_res.append(rec_result)
+                filter_positions.append(position)
+        if stats is not None:
+            stats["layout"] = remap_layout(layout, filter_positions)
+            if self.text_recognizer.cache is not None:
+                # 累计命中率（进程内所有调用）
+                stats["rec_cache"] = self.text_recognizer.cache.stats()
+            if self.text_recognizer.cascade_session is not None:
+                # 累计送入第二级识别的比例（进程内所有调用）
+                stats["rec_cascade"] = self.text_recognizer.cascade_stats()
+
+        # 框坐标映射回原图：先撤销倾斜校正，再撤销整页方向旋转
+        if deskew_M is not None and filter_boxes:
+            filter_boxes = list(self.deskew.unrotate_boxes(filter_boxes, deskew_M))
+        if page_angle and filter_boxes:
+            filter_boxes = list(unrotate_boxes(filter_boxes, page_angle, oriented_shape))
+
+        # 裁剪图的编码写盘与上面的后处理重叠，返回前确保已写完，写入失败在此抛出
+        if self.args.save_crop_res:
+            self.crop_writer.flush()
 
         return filter_boxes, filter_rec_res
 
@@ -80,18 +472,5 @@ def sorted_boxes(dt_boxes):
     return:
         sorted boxes(array) with shape [4, 2]
     """
-    num_boxes = dt_boxes.shape[0]
-    sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-    _boxes = list(sorted_boxes)
-
-    for i in range(num_boxes - 1):
-        for j in range(i, -1, -1):
-            if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and (
-                _boxes[j + 1][0][0] < _boxes[j][0][0]
-            ):
-                tmp = _boxes[j]
-                _boxes[j] = _boxes[j + 1]
-                _boxes[j + 1] = tmp
-            else:
-                break
-    return _boxes
+    order = ReadingOrder()(dt_boxes)["order"]
+    return [dt_boxes[i] for i in order]
@@ -0,0 +1,120 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class QualityGate(object):
+    """
+    完整识别前的快速质量检查（分诊）：模糊、曝光、反光和文字面积。
+
+    整图只缩小一次（长边 triage_det_side），曝光和反光在更小的 triage_side 图上统计：
+        sharpness: 灰度图拉普拉斯响应的方差，越小越模糊
+        black / white: 灰度 1% 和 99% 分位数，白点过低为过暗，黑点过高为过曝（没有深色内容），
+            两者之差过小为低对比度
+        glare: 接近饱和的白色区域占比，不计与图片边缘相连的区域（扫描件的白底、白色背景）
+        text_area: 检测框并集占图片面积的比例，boxes 为检测框数
+    图片指标已不合格时跳过检测，不再计算 text_area。所有阈值为 0 时表示不检查对应指标。
+    """
+
+    def __init__(self, args):
+        self.side = args.triage_side
+        self.det_side = args.triage_det_side
+        self.min_sharpness = args.triage_min_sharpness
+        self.min_white = args.triage_min_white
+        self.max_black = args.triage_max_black
+        self.min_contrast = args.triage_min_contrast
+        self.max_glare = args.triage_max_glare
+        self.min_text_area = args.triage_min_text_area
+        self.min_boxes = args.triage_min_boxes
+        # 灰度不低于该值且饱和度不高于 glare_max_sat 的像素记为反光
+        self.glare_level = 250
+        self.glare_max_sat = 40
+
+    @staticmethod
+    def downscale(img, side, interpolation=cv2.INTER_AREA):
+        h, w = img.shape[:2]
+        ratio = side / float(max(h, w))
+        if ratio >= 1:
+            return img
+        size = (max(int(round(w * ratio)), 1), max(int(round(h * ratio)), 1))
+        return cv2.resize(img, size, interpolation=interpolation)
+
+    def measure(self, img):
+        """图片本身的指标（不含检测），img 为 BGR 或灰度图"""
+        # 通常是从检测图小比例缩小，双线性足够，比 INTER_AREA 快得多
+        small = self.downscale(img, self.side, cv2.INTER_LINEAR)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        sharpness = float(cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))[1][0, 0] ** 2)
+        cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256)) / float(gray.size)
+        black, white = np.searchsorted(cdf, (0.01, 0.99))
+
+        clipped = gray >= self.glare_level
+        if small.ndim == 3:
+            sat = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)[:, :, 1]
+            clipped &= sat <= self.glare_max_sat
+        glare = 0.0
+        if clipped.any():
+            num, labels = cv2.connectedComponents(clipped.view(np.uint8), connectivity=4)
+            border = np.unique(
+                np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]])
+            )
+            inner = np.ones(num, dtype=bool)
+            inner[0] = False
+            inner[border] = False
+            glare = float(inner[labels].mean())
+        return {
+            "sharpness": sharpness,
+            "brightness": float(gray.mean()),
+            "black": float(black),
+            "white": float(white),
+            "glare": glare,
+        }
+
+    def image_reasons(self, metrics):
+        reasons = []
+        if self.min_sharpness > 0 and metrics["sharpness"] < self.min_sharpness:
+            reasons.append("blurry")
+        if self.min_white > 0 and metrics["white"] < self.min_white:
+            reasons.append("too_dark")
+        if self.max_black > 0 and metrics["black"] > self.max_black:
+            reasons.append("overexposed")
+        if self.min_contrast > 0 and metrics["white"] - metrics["black"] < self.min_contrast:
+            reasons.append("low_contrast")
+        if self.max_glare > 0 and metrics["glare"] > self.max_glare:
+            reasons.append("glare")
+        return reasons
+
+    @staticmethod
+    def text_area(dt_boxes, shape):
+        """检测框并集的面积占比"""
+        if dt_boxes is None or len(dt_boxes) == 0:
+            return 0.0
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        polys = [np.round(np.asarray(box)).astype(np.int32).reshape(-1, 2) for box in dt_boxes]
+        cv2.fillPoly(mask, polys, 1)
+        return float(mask.mean())
+
+    def __call__(self, img, text_detector=None):
+        """
+        text_detector: 用于计算文字面积的检测器，为 None 时只检查图片指标
+        return: {"accept", "reasons", "metrics", "elapsed_ms"}
+        """
+        start = time.time()
+        det_img = self.downscale(img, self.det_side)
+        metrics = self.measure(det_img)
+        reasons = self.image_reasons(metrics)
+        if text_detector is not None and not reasons:
+            dt_boxes = text_detector(det_img, limit_side_len=self.det_side)
+            metrics["boxes"] = 0 if dt_boxes is None else len(dt_boxes)
+            metrics["text_area"] = self.text_area(dt_boxes, det_img.shape)
+            if (self.min_boxes > 0 and metrics["boxes"] < self.min_boxes) or (
+                self.min_text_area > 0 and metrics["text_area"] < self.min_text_area
+            ):
+                reasons.append("no_text")
+        return {
+            "accept": not reasons,
+            "reasons": reasons,
+            "metrics": metrics,
+            "elapsed_ms": (time.time() - start) * 1000,
+        }
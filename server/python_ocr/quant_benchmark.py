@@ -0,0 +1,105 @@
+"""
+对比量化模型与 FP32 模型：速度、模型大小和识别精度（相对 FP32 输出的 CER）
+
+    python quant_benchmark.py --image_dir ./test_images --model_dir models/ppocrv5
+
+每次只替换一个阶段（det/cls/rec）的模型，其余阶段保持 FP32，
+便于选择例如 INT8 rec + FP32 det 的组合。
+"""
+import argparse
+import os
+import time
+
+import cv2
+
+from onnx_paddleocr import ONNXPaddleOcr
+from quantize_models import STAGES, list_images, stage_model_paths
+from utils import QUANT_VARIANTS, quantized_model_path
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        prev = cur
+    return prev[-1]
+
+
+def char_error_rate(refs, hyps):
+    errors = sum(edit_distance(r, h) for r, h in zip(refs, hyps))
+    total = sum(len(r) for r in refs)
+    return errors / max(total, 1)
+
+
+def result_text(result):
+    if not result or not result[0]:
+        return ""
+    return "\n".join(line[1][0] for line in result[0])
+
+
+def run_model(model, images, repeat=1):
+    for img in images[:1]:  # warmup
+        model.ocr(img)
+    texts = []
+    start = time.time()
+    for _ in range(repeat):
+        texts = [result_text(model.ocr(img)) for img in images]
+    elapsed = (time.time() - start) / max(len(images) * repeat, 1)
+    return texts, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image_dir", type=str, required=True)
+    parser.add_argument("--model_dir", type=str, default="models/ppocrv5")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--use_angle_cls", type=str, default="true")
+    args = parser.parse_args()
+
+    paths = stage_model_paths(args.model_dir)
+    base_kwargs = dict(
+        use_gpu=False,
+        use_angle_cls=args.use_angle_cls.lower() in ("true", "t", "1"),
+        det_model_dir=paths["det"],
+        cls_model_dir=paths["cls"],
+        rec_model_dir=paths["rec"],
+        rec_char_dict_path=os.path.join(args.model_dir, "ppocrv5_dict.txt"),
+    )
+    images = [img for img in (cv2.imread(f) for f in list_images(args.image_dir)) if img is not None]
+    if not images:
+        parser.error("no images found in {}".format(args.image_dir))
+
+    ref_texts, ref_time = run_model(ONNXPaddleOcr(**base_kwargs), images, args.repeat)
+    rows = [("all", "fp32", ref_time * 1000, 1.0, None, 0.0)]
+    for stage in STAGES:
+        for variant in QUANT_VARIANTS[1:]:
+            variant_path = quantized_model_path(paths[stage], variant)
+            if not os.path.exists(variant_path):
+                continue
+            model = ONNXPaddleOcr(**dict(base_kwargs, **{stage + "_quant": variant}))
+            texts, elapsed = run_model(model, images, args.repeat)
+            rows.append(
+                (
+                    stage,
+                    variant,
+                    elapsed * 1000,
+                    ref_time / elapsed,
+                    os.path.getsize(variant_path) / os.path.getsize(paths[stage]),
+                    char_error_rate(ref_texts, texts),
+                )
+            )
+
+    print("{:<6}{:<14}{:>12}{:>10}{:>8}{:>10}".format("stage", "variant", "ms/img", "speedup", "size", "CER"))
+    for stage, variant, ms, speedup, size, cer in rows:
+        size = "-" if size is None else "{:.0%}".format(size)
+        print(
+            "{:<6}{:<14}{:>12.1f}{:>9.2f}x{:>8}{:>10.4f}".format(
+                stage, variant, ms, speedup, size, cer
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
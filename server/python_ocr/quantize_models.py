@@ -0,0 +1,190 @@
+"""
+生成 det/cls/rec 模型的 INT8 量化版本（需要额外安装 onnx）
+
+    python quantize_models.py --model_dir models/ppocrv5 --calib_dir ./calib_images
+
+动态量化不需要校准数据；静态量化用 calib_dir 中的图片做校准：
+det 直接使用预处理后的整图，cls/rec 使用 FP32 检测模型裁剪出的文本行。
+生成的模型与原模型放在同一目录，例如 rec/rec_int8_dynamic.onnx，
+之后通过 ONNXPaddleOcr(rec_quant="int8_dynamic") 按阶段加载。
+"""
+import argparse
+import glob
+import os
+
+import cv2
+import numpy as np
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from imaug import transform
+from utils import get_rotate_crop_image, quantized_model_path
+
+STAGES = ("det", "cls", "rec")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class TensorDataReader(CalibrationDataReader):
+    """按顺序逐个提供校准输入"""
+
+    def __init__(self, input_name, tensors):
+        self.input_name = input_name
+        self.tensors = iter(tensors)
+
+    def get_next(self):
+        tensor = next(self.tensors, None)
+        if tensor is None:
+            return None
+        return {self.input_name: tensor}
+
+
+def stage_model_paths(model_dir):
+    return {stage: os.path.join(model_dir, stage, stage + ".onnx") for stage in STAGES}
+
+
+def list_images(image_dir):
+    files = []
+    for ext in IMAGE_EXTS:
+        files.extend(glob.glob(os.path.join(image_dir, "**", "*" + ext), recursive=True))
+    return sorted(files)
+
+
+def collect_calibration_tensors(model, image_files, max_crops=500):
+    """
+    用 FP32 模型生成各阶段的校准输入
+    return: {"det": [...], "cls": [...], "rec": [...]}
+    """
+    tensors = {stage: [] for stage in STAGES}
+    detector = model.text_detector
+    cls_op = model.text_classifier
+    rec_op = model.text_recognizer
+    _, rec_h, rec_w = rec_op.rec_image_shape
+    crop_num = 0
+    for file in image_files:
+        img = cv2.imread(file)
+        if img is None:
+            continue
+        det_img, _ = transform({"image": img}, detector.preprocess_op)
+        tensors["det"].append(np.expand_dims(det_img, axis=0).astype(np.float32))
+
+        dt_boxes = detector(img)
+        for box in dt_boxes:
+            if crop_num >= max_crops:
+                break
+            crop = get_rotate_crop_image(img, np.array(box, dtype=np.float32))
+            tensors["cls"].append(cls_op.resize_norm_img(crop)[np.newaxis, :])
+            wh_ratio = max(crop.shape[1] / float(crop.shape[0]), rec_w / float(rec_h))
+            tensors["rec"].append(rec_op.resize_norm_img(crop, wh_ratio)[np.newaxis, :])
+            crop_num += 1
+    return tensors
+
+
+def preprocess_for_quant(model_path):
+    """量化前做 shape 推理和图优化，失败时直接使用原模型"""
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError:
+        return model_path
+    pre_path = model_path.replace(".onnx", "_preprocessed.onnx")
+    try:
+        quant_pre_process(model_path, pre_path)
+    except Exception as e:
+        print("[quant] pre-process skipped for {}: {}".format(model_path, e))
+        return model_path
+    return pre_path
+
+
+def quantize_stage(model_path, variant, calib_tensors=None, input_name=None):
+    out_path = quantized_model_path(model_path, variant)
+    src_path = preprocess_for_quant(model_path)
+    if variant == "int8_dynamic":
+        quantize_dynamic(src_path, out_path, weight_type=QuantType.QUInt8)
+    elif variant == "int8_static":
+        if not calib_tensors:
+            raise ValueError("static quantization of {} needs calibration data".format(model_path))
+        quantize_static(
+            src_path,
+            out_path,
+            TensorDataReader(input_name, calib_tensors),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    else:
+        raise ValueError("unknown quant variant: {}".format(variant))
+    if src_path != model_path and os.path.exists(src_path):
+        os.remove(src_path)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, default="models/ppocrv5")
+    parser.add_argument("--rec_char_dict_path", type=str, default=None)
+    parser.add_argument("--calib_dir", type=str, default=None)
+    parser.add_argument("--calib_num", type=int, default=500)
+    parser.add_argument("--stages", type=str, default="det,cls,rec")
+    parser.add_argument("--variants", type=str, default="int8_dynamic,int8_static")
+    args = parser.parse_args()
+
+    paths = stage_model_paths(args.model_dir)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+
+    calib = None
+    input_names = {}
+    if "int8_static" in variants:
+        if not args.calib_dir:
+            parser.error("--calib_dir is required for int8_static")
+        from onnx_paddleocr import ONNXPaddleOcr
+
+        model = ONNXPaddleOcr(
+            use_angle_cls=True,
+            use_gpu=False,
+            det_model_dir=paths["det"],
+            cls_model_dir=paths["cls"],
+            rec_model_dir=paths["rec"],
+            rec_char_dict_path=args.rec_char_dict_path
+            or os.path.join(args.model_dir, "ppocrv5_dict.txt"),
+        )
+        calib = collect_calibration_tensors(
+            model, list_images(args.calib_dir), max_crops=args.calib_num
+        )
+        input_names = {
+            "det": model.text_detector.det_input_name[0],
+            "cls": model.text_classifier.cls_input_name[0],
+            "rec": model.text_recognizer.rec_input_name[0],
+        }
+        print(
+            "[quant] calibration: {} images, {} crops".format(
+                len(calib["det"]), len(calib["rec"])
+            )
+        )
+
+    for stage in stages:
+        for variant in variants:
+            out_path = quantize_stage(
+                paths[stage],
+                variant,
+                calib_tensors=calib[stage] if calib else None,
+                input_name=input_names.get(stage),
+            )
+            print(
+                "[quant] {} {}: {} ({:.1f} MB -> {:.1f} MB)".format(
+                    stage,
+                    variant,
+                    out_path,
+                    os.path.getsize(paths[stage]) / 1e6,
+                    os.path.getsize(out_path) / 1e6,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
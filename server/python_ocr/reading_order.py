@@ -0,0 +1,152 @@
+import numpy as np
+
+
+class ReadingOrder(object):
+    """
+    阅读顺序：把检测框聚成行、段落和栏，并给出整体的阅读顺序。
+
+    同一行的判定阈值按框高缩放（line_tol * 框高），全部计算基于排序和
+    numpy 向量运算，复杂度 O(n log n)。
+    返回 dict:
+        order: 阅读顺序下的框下标
+        lines: 每行的框下标（行内从左到右）
+        paragraphs: 每段包含的行号（lines 的下标）
+        columns: 每栏包含的行号
+    """
+
+    def __init__(self, line_tol=0.5, para_gap=0.8, col_gap=3.0, use_columns=False):
+        self.line_tol = line_tol
+        self.para_gap = para_gap
+        self.col_gap = col_gap
+        self.use_columns = use_columns
+
+    def box_geometry(self, dt_boxes):
+        if isinstance(dt_boxes, np.ndarray) and dt_boxes.dtype != object:
+            pts = dt_boxes.reshape(len(dt_boxes), -1, 2).astype(np.float32)
+            x_min, x_max = pts[:, :, 0].min(axis=1), pts[:, :, 0].max(axis=1)
+            y_min, y_max = pts[:, :, 1].min(axis=1), pts[:, :, 1].max(axis=1)
+        else:
+            bounds = np.array(
+                [
+                    np.concatenate(
+                        [np.min(np.reshape(b, (-1, 2)), 0), np.max(np.reshape(b, (-1, 2)), 0)]
+                    )
+                    for b in dt_boxes
+                ],
+                dtype=np.float32,
+            )
+            x_min, y_min, x_max, y_max = bounds.T
+        return x_min, x_max, y_min, y_max
+
+    def split_columns(self, x_min, x_max, unit):
+        """
+        按 x 方向的空白把框分栏：区间按左端排序后与已合并区间的最右端比较，
+        间隔超过 col_gap * unit 则开新栏
+        """
+        n = len(x_min)
+        order = np.argsort(x_min, kind="stable")
+        reach = np.maximum.accumulate(x_max[order])
+        breaks = x_min[order][1:] > reach[:-1] + self.col_gap * unit
+        col_sorted = np.concatenate([[0], np.cumsum(breaks)])
+        col_id = np.empty(n, dtype=np.int64)
+        col_id[order] = col_sorted
+        return col_id
+
+    def __call__(self, dt_boxes):
+        n = len(dt_boxes)
+        if n == 0:
+            return {"order": [], "lines": [], "paragraphs": [], "columns": []}
+        x_min, x_max, y_min, y_max = self.box_geometry(dt_boxes)
+        height = np.maximum(y_max - y_min, 1.0)
+        center_y = (y_min + y_max) / 2
+        unit = float(np.median(height))
+
+        col_id = self.split_columns(x_min, x_max, unit)
+        if not self.use_columns:
+            group = np.zeros(n, dtype=np.int64)
+        else:
+            group = col_id
+
+        # 按 (栏, 中心 y) 排序，相邻框中心距超过阈值或换栏时断行
+        by_y = np.lexsort((center_y, group))
+        cy, h, g = center_y[by_y], height[by_y], group[by_y]
+        breaks = (np.diff(cy) > self.line_tol * np.minimum(h[1:], h[:-1])) | (
+            np.diff(g) != 0
+        )
+        line_sorted = np.concatenate([[0], np.cumsum(breaks)])
+        line_id = np.empty(n, dtype=np.int64)
+        line_id[by_y] = line_sorted
+
+        # 行内从左到右
+        order = np.lexsort((x_min, line_id))
+        starts = np.flatnonzero(np.diff(np.concatenate([[-1], line_id[order]])))
+        lines = [seg.tolist() for seg in np.split(order, starts[1:])]
+
+        # 段落：同一栏内行间距超过 para_gap * 行高时分段
+        line_top = np.minimum.reduceat(y_min[order], starts)
+        line_bottom = np.maximum.reduceat(y_max[order], starts)
+        line_group = group[order][starts]
+        line_h = np.maximum.reduceat(height[order], starts)
+        para_breaks = (
+            line_top[1:] - line_bottom[:-1] > self.para_gap * np.minimum(line_h[1:], line_h[:-1])
+        ) | (np.diff(line_group) != 0)
+        paragraphs = self.group_runs(np.concatenate([[0], np.cumsum(para_breaks)]))
+
+        # 栏：每行归入其第一个框所在的栏
+        line_col = col_id[order][starts]
+        col_order = np.argsort(line_col, kind="stable")
+        col_starts = np.flatnonzero(np.diff(np.concatenate([[-1], line_col[col_order]])))
+        columns = [seg.tolist() for seg in np.split(col_order, col_starts[1:])]
+
+        return {
+            "order": order.tolist(),
+            "lines": lines,
+            "paragraphs": paragraphs,
+            "columns": columns,
+        }
+
+    @staticmethod
+    def group_runs(run_id):
+        starts = np.flatnonzero(np.diff(np.concatenate([[-1], run_id])))
+        return [seg.tolist() for seg in np.split(np.arange(len(run_id)), starts[1:])]
+
+
+def remap_layout(layout, kept):
+    """
+    把 layout 中的框下标换算为过滤后的下标。
+    kept: 按阅读顺序排列后被保留的位置（即 layout["order"] 的下标）
+    """
+    position = {layout["order"][p]: i for i, p in enumerate(kept)}
+    lines, line_map = [], {}
+    for lno, line in enumerate(layout["lines"]):
+        new_line = [position[b] for b in line if b in position]
+        if new_line:
+            line_map[lno] = len(lines)
+            lines.append(new_line)
+
+    def remap_groups(groups):
+        result = []
+        for group in groups:
+            new_group = [line_map[lno] for lno in group if lno in line_map]
+            if new_group:
+                result.append(new_group)
+        return result
+
+    return {
+        "order": list(range(len(kept))),
+        "lines": lines,
+        "paragraphs": remap_groups(layout["paragraphs"]),
+        "columns": remap_groups(layout["columns"]),
+    }
+
+
+def layout_to_text(texts, layout):
+    """
+    按行、段落拼接文本：行内空格分隔，行间换行，段间空一行
+    """
+    paragraphs = []
+    for paragraph in layout["paragraphs"]:
+        paragraphs.append(
+            "\n".join(" ".join(texts[b] for b in layout["lines"][lno]) for lno in paragraph)
+        )
+    return "\n\n".join(paragraphs)
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class RecCache(object):
+    """
+    跨调用的识别结果缓存：证件上反复出现的固定文字（机构名、字段标签等）只识别一次。
+        capacity: 最多缓存的文本行数，按 LRU 淘汰
+        min_score: 置信度下限，低于该值的识别结果不写入，命中的结果也不会低于该值
+        tol: 校验阈值，逐列块比较归一化缩略图，任一列块的平均差异超过 tol 即视为不同的行
+        thumb_h: 缩略图高度（像素）
+        aspect_step: 宽高比分桶的步长，不同桶的行不会互相命中
+    键为 (宽高比桶, 感知哈希)：文本行灰度化、裁掉空白边后缩放到固定高度、按亮度和对比度归一化，
+    再 4 倍降采样并与均值比较得到哈希。哈希相同或相近（同桶内汉明距离不超过位数的 1/8）
+    的候选还要用缩略图逐块校验，
+    只差一个字符（如证件号码的一位）的行在对应列块上差异明显，不会误命中。
+    线程安全，多个识别线程共用同一个缓存。
+    """
+
+    def __init__(self, capacity=1024, min_score=0.95, tol=0.2, thumb_h=16, aspect_step=0.25, max_thumb_w=512, max_probes=8):
+        self.capacity = capacity
+        self.min_score = min_score
+        self.tol = tol
+        self.thumb_h = thumb_h
+        self.aspect_step = aspect_step
+        self.max_thumb_w = max_thumb_w
+        self.max_probes = max_probes
+        self.block = 4
+        self._entries = OrderedDict()
+        # 宽高比桶 -> 该桶中已缓存的哈希，用于查找汉明距离相近的候选
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def thumbnail(self, img):
+        """return: (键, 归一化缩略图)"""
+        gray = self._trim(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img)
+        h, w = gray.shape[:2]
+        bucket = max(1, int(round(w / float(max(h, 1)) / self.aspect_step)))
+        # 缩略图宽度由桶决定，同一个键下的缩略图尺寸相同
+        thumb_w = int(round(bucket * self.aspect_step * self.thumb_h))
+        thumb_w = min(max(thumb_w // self.block * self.block, self.block), self.max_thumb_w)
+        thumb = cv2.resize(gray, (thumb_w, self.thumb_h), interpolation=cv2.INTER_AREA)
+        thumb = thumb.astype(np.float32)
+        thumb = (thumb - thumb.mean()) / (thumb.std() + 1.0)
+        small = cv2.resize(thumb, (thumb_w // 4 or 1, self.thumb_h // 4), interpolation=cv2.INTER_AREA)
+        key = (bucket, int.from_bytes(np.packbits(small > 0).tobytes(), "big"))
+        return key, thumb
+
+    @staticmethod
+    def _trim(gray):
+        """裁掉文字外的空白边，检测框边距不同的同一行得到相同的缩略图"""
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # 文字为占少数的一类像素，兼容深底浅字
+        ink = binary == 0 if np.count_nonzero(binary) * 2 > binary.size else binary > 0
+        rows = np.flatnonzero(ink.any(axis=1))
+        cols = np.flatnonzero(ink.any(axis=0))
+        if len(rows) < 2 or len(cols) < 2:
+            return gray
+        return gray[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+
+    def _verify(self, a, b):
+        diff = np.abs(a - b).reshape(a.shape[0], -1, self.block).mean(axis=(0, 2))
+        return float(diff.max()) <= self.tol
+
+    def _candidates(self, key, nbits):
+        """同桶中哈希相同或汉明距离不超过 1/8 位数的候选，按距离排序"""
+        bucket, code = key
+        if key in self._entries:
+            return [key]
+        near = []
+        for other in self._buckets.get(bucket, ()):
+            distance = bin(code ^ other).count("1")
+            if distance * 8 <= nbits:
+                near.append((distance, other))
+        near.sort()
+        return [(bucket, other) for _, other in near[: self.max_probes]]
+
+    def get(self, key, thumb):
+        """命中时返回缓存的识别结果，否则返回 None"""
+        nbits = (thumb.shape[1] // 4 or 1) * (self.thumb_h // 4)
+        with self._lock:
+            candidates = self._candidates(key, nbits)
+            for candidate in candidates:
+                cached_thumb, result = self._entries[candidate]
+                if self._verify(cached_thumb, thumb) and result[1] >= self.min_score:
+                    self._entries.move_to_end(candidate)
+                    self.hits += 1
+                    return result
+            if candidates:
+                self.rejected += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, thumb, result):
+        if result[1] < self.min_score:
+            return
+        with self._lock:
+            self._entries[key] = (thumb, result)
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(key[0], set()).add(key[1])
+            while len(self._entries) > self.capacity:
+                (bucket, code), _ = self._entries.popitem(last=False)
+                self._buckets[bucket].discard(code)
+
+    def stats(self):
+        """命中数、未命中数（含校验未通过的 rejected）、命中率和当前条目数"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_rate": self.hits / float(lookups) if lookups else 0.0,
+                "size": len(self._entries),
+            }
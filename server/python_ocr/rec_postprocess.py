@@ -94,15 +94,22 @@ class CTCLabelDecode(BaseRecLabelDecode):
 
     def __init__(self, character_dict_path=None, use_space_char=False, **kwargs):
         super(CTCLabelDecode, self).__init__(character_dict_path, use_space_char)
+        # 预先构建下标 -> 字符的数组，解码时直接按下标整体取值
+        self.character_array = np.array(self.character, dtype=object)
 
-    def __call__(self, preds, label=None, *args, **kwargs):
+    def __call__(self, preds, label=None, return_char_info=False, *args, **kwargs):
         if isinstance(preds, tuple) or isinstance(preds, list):
             preds = preds[-1]
         # if isinstance(preds, paddle.Tensor):
         #     preds = preds.numpy()
         preds_idx = preds.argmax(axis=2)
-        preds_prob = preds.max(axis=2)
-        text = self.decode(preds_idx, preds_prob, is_remove_duplicate=True)
+        # 取 argmax 位置的概率，避免对整个 (B, T, C) 输出再做一次 max 归约
+        preds_prob = np.take_along_axis(preds, preds_idx[:, :, np.newaxis], axis=2)[
+            :, :, 0
+        ]
+        text = self.decode_batch(
+            preds_idx, preds_prob, return_char_info=return_char_info
+        )
         if label is None:
             return text
         label = self.decode(label)
@@ -112,6 +119,48 @@ class CTCLabelDecode(BaseRecLabelDecode):
         dict_character = ["blank"] + dict_character
         return dict_character
 
+    def decode_batch(self, text_index, text_prob, return_char_info=False):
+        """
+        整个 batch 一次完成 CTC 去重和去 blank，结果与
+        decode(text_index, text_prob, is_remove_duplicate=True) 一致。
+        return_char_info 为 True 时每条结果额外返回逐字符置信度和对应的时间步：
+        (text, score, char_scores, char_positions)
+        """
+        text_index = np.asarray(text_index)
+        batch_size = text_index.shape[0]
+
+        selection = np.ones(text_index.shape, dtype=bool)
+        selection[:, 1:] = text_index[:, 1:] != text_index[:, :-1]
+        for ignored_token in self.get_ignored_tokens():
+            selection &= text_index != ignored_token
+
+        rows, cols = np.nonzero(selection)
+        chars = self.character_array[text_index[rows, cols]]
+        probs = np.asarray(text_prob, dtype=np.float32)[rows, cols]
+        counts = np.bincount(rows, minlength=batch_size)
+        sums = np.bincount(rows, weights=probs, minlength=batch_size)
+        scores = np.divide(
+            sums, counts, out=np.zeros(batch_size, dtype=np.float64), where=counts > 0
+        )
+
+        splits = np.cumsum(counts)[:-1]
+        char_groups = np.split(chars, splits)
+        result_list = []
+        for batch_idx in range(batch_size):
+            text = "".join(char_groups[batch_idx])
+            if self.reverse:  # for arabic rec
+                text = self.pred_reverse(text)
+            result_list.append((text, float(scores[batch_idx])))
+
+        if return_char_info:
+            prob_groups = np.split(probs, splits)
+            pos_groups = np.split(cols, splits)
+            result_list = [
+                (text, score, prob_groups[i].tolist(), pos_groups[i].tolist())
+                for i, (text, score) in enumerate(result_list)
+            ]
+        return result_list
+
 
 class DistillationCTCLabelDecode(CTCLabelDecode):
     """
@@ -0,0 +1,190 @@
+"""
+多进程共享模型权重
+
+    python shared_weights.py --model_dir models/ppocrv5
+
+把 det/cls/rec 模型预先用 onnxruntime 离线优化（算子融合后的权重不会在加载时再变），
+再把较大的权重按页对齐写入单独的权重文件，生成 det/det_shared.onnx、det/det_shared.weights
+及其索引 det_shared.weights.json。之后通过 ONNXPaddleOcr(shared_weights=True) 加载：
+权重文件以只读方式内存映射，作为预分配的 initializer 交给 onnxruntime 直接使用，
+同一进程内的多个会话共用同一份 OrtValue，多个工作进程映射的是同一份页缓存，
+物理内存中只有一份权重。生成模型需要额外安装 onnx，加载时不需要。
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+import onnxruntime
+
+from utils import QUANT_VARIANTS, quantized_model_path, shared_model_path
+
+STAGES = ("det", "cls", "rec")
+PAGE_SIZE = 4096
+
+
+def weights_path(shared_path):
+    return os.path.splitext(shared_path)[0] + ".weights"
+
+
+def export_shared_model(model_path, out_path=None, min_bytes=4096, optimize=True):
+    """
+    生成共享权重格式的模型，return: 输出模型路径
+    min_bytes: 小于该大小的权重（偏置、形状常量等）仍保留在模型文件中
+    optimize: 先做离线图优化（ORT_ENABLE_EXTENDED），融合 Conv+BN 等，
+        加载时不再生成新的权重副本
+    """
+    import onnx
+    from onnx import numpy_helper
+
+    out_path = out_path or shared_model_path(model_path)
+    src_path = model_path
+    if optimize:
+        src_path = os.path.splitext(out_path)[0] + ".opt.onnx"
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        sess_options.optimized_model_filepath = src_path
+        onnxruntime.InferenceSession(model_path, sess_options, providers=["CPUExecutionProvider"])
+    model = onnx.load(src_path)
+    if src_path != model_path:
+        os.remove(src_path)
+
+    blob_path = weights_path(out_path)
+    index = []
+    offset = 0
+    with open(blob_path, "wb") as f:
+        for tensor in model.graph.initializer:
+            array = numpy_helper.to_array(tensor)
+            if array.nbytes < min_bytes or array.dtype == object:
+                continue
+            # 每个权重从页边界开始，映射后的视图满足任意 dtype 的对齐要求
+            offset = (offset + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+            f.seek(offset)
+            f.write(np.ascontiguousarray(array).tobytes())
+            index.append(
+                dict(name=tensor.name, dtype=array.dtype.str, shape=list(array.shape), offset=offset)
+            )
+            # 模型中保留外部数据引用，不经共享加载时也是可用的模型
+            tensor.ClearField("raw_data")
+            for field in ("float_data", "int32_data", "int64_data", "double_data", "uint64_data"):
+                tensor.ClearField(field)
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+            del tensor.external_data[:]
+            for key, value in (
+                ("location", os.path.basename(blob_path)),
+                ("offset", str(offset)),
+                ("length", str(array.nbytes)),
+            ):
+                entry = tensor.external_data.add()
+                entry.key, entry.value = key, value
+            offset += array.nbytes
+    onnx.save(model, out_path)
+    with open(blob_path + ".json", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return out_path
+
+
+class SharedWeights(object):
+    """
+    内存映射的权重文件，每个权重一个指向映射内存的 OrtValue（不复制）。
+    同一进程内按路径缓存，用 SharedWeights.load 获取
+    """
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, shared_path):
+        blob_path = weights_path(shared_path)
+        with open(blob_path + ".json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        # 没有大权重时权重文件为空，不能映射
+        self.mmap = np.memmap(blob_path, dtype=np.uint8, mode="r") if index else np.zeros(0, np.uint8)
+        self.ortvalues = {}
+        for entry in index:
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            array = np.frombuffer(self.mmap, dtype=dtype, count=count, offset=entry["offset"])
+            self.ortvalues[entry["name"]] = onnxruntime.OrtValue.ortvalue_from_numpy(
+                array.reshape(entry["shape"])
+            )
+
+    @classmethod
+    def load(cls, shared_path):
+        key = os.path.abspath(shared_path)
+        with cls._cache_lock:
+            weights = cls._cache.get(key)
+            if weights is None:
+                weights = cls._cache[key] = cls(shared_path)
+            return weights
+
+    @property
+    def nbytes(self):
+        return self.mmap.nbytes
+
+    def apply(self, sess_options, prepack=False):
+        """
+        把权重作为预分配的 initializer 加入会话选项
+        prepack: 是否保留 onnxruntime 的权重预打包。预打包为每个会话生成一份私有的
+            MatMul 权重重排副本（Python 接口无法跨会话共享），计算更快，但抵消了共享节省的内存
+        """
+        for name, value in self.ortvalues.items():
+            sess_options.add_initializer(name, value)
+        if not prepack:
+            sess_options.add_session_config_entry("session.disable_prepacking", "1")
+        # 权重已离线优化；ORT_ENABLE_ALL 的 NCHWc 布局转换会重排卷积权重，产生私有副本
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        return sess_options
+
+
+def memory_usage():
+    """
+    当前进程的内存占用（MB）：rss 常驻内存，anon 私有匿名内存，file 文件映射（含共享权重），
+    pss 按共享进程数均摊后的占用；非 Linux 时只有 rss（峰值）
+    """
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    usage[{"VmRSS": "rss", "RssAnon": "anon", "RssFile": "file"}[key]] = int(value.split()[0]) / 1024.0
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    usage["pss"] = int(line.split()[1]) / 1024.0
+    except OSError:
+        import resource
+
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_dir", type=str, required=True, help="含 det/cls/rec 子目录的模型目录")
+    parser.add_argument("--variants", type=str, default="fp32", help="逗号分隔的精度版本，如 fp32,int8_dynamic")
+    parser.add_argument("--min_bytes", type=int, default=4096)
+    parser.add_argument("--no_optimize", action="store_true", help="不做离线图优化")
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    for variant in variants:
+        if variant not in QUANT_VARIANTS:
+            parser.error("unknown variant {}, expected one of {}".format(variant, QUANT_VARIANTS))
+    model_paths = [
+        quantized_model_path(os.path.join(args.model_dir, stage, stage + ".onnx"), variant)
+        for stage in STAGES
+        for variant in variants
+    ]
+    for model_path in model_paths:
+        if not os.path.exists(model_path):
+            print("skip: {} not found".format(model_path))
+            continue
+        out_path = export_shared_model(model_path, min_bytes=args.min_bytes, optimize=not args.no_optimize)
+        size = os.path.getsize(weights_path(out_path)) / 1024.0 / 1024.0
+        print("{} -> {} ({:.1f} MB shared weights)".format(model_path, out_path, size))
+
+
+if __name__ == "__main__":
+    main()
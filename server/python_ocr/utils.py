@@ -1,7 +1,9 @@
+import os
 import numpy as np
 import cv2
 import argparse
 import math
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 from pathlib import Path
 
@@ -9,6 +11,35 @@ from pathlib import Path
 module_dir = Path(__file__).resolve().parent
 
 
+def axis_aligned_rect(points, img_shape=None, tol=1.0):
+    """
+    框的四边与坐标轴平行（偏差不超过 tol 像素，且不超过框高的 5%）时
+    返回可直接切片的 (left, top, right, bottom)，尺寸与透视变换裁剪的结果相同；
+    否则，或超出图片范围、第一个点不是左上角（文字不是正向）时返回 None
+    """
+    points = np.asarray(points, dtype=np.float32)
+    height = max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2]))
+    tol = max(tol, 0.05 * height)
+    if (
+        points[1][0] <= points[0][0]
+        or points[3][1] <= points[0][1]
+        or abs(points[0][1] - points[1][1]) > tol
+        or abs(points[3][1] - points[2][1]) > tol
+        or abs(points[0][0] - points[3][0]) > tol
+        or abs(points[1][0] - points[2][0]) > tol
+    ):
+        return None
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(height)
+    left = int(round(min(points[0][0], points[3][0])))
+    top = int(round(min(points[0][1], points[1][1])))
+    if width <= 0 or height <= 0 or left < 0 or top < 0:
+        return None
+    if img_shape is not None and (left + width > img_shape[1] or top + height > img_shape[0]):
+        return None
+    return left, top, left + width, top + height
+
+
 def get_rotate_crop_image(img, points):
     """
     img_height, img_width = img.shape[0:2]
@@ -21,6 +52,14 @@ def get_rotate_crop_image(img, points):
     points[:, 1] = points[:, 1] - top
     """
     assert len(points) == 4, "shape of points must be 4*2"
+    # 水平的框直接切片，省去透视变换；返回副本，与透视变换一样不与原图共享内存
+    rect = axis_aligned_rect(points, img.shape)
+    if rect is not None:
+        left, top, right, bottom = rect
+        dst_img = img[top:bottom, left:right].copy()
+        if dst_img.shape[0] * 1.0 / dst_img.shape[1] >= 1.5:
+            dst_img = np.rot90(dst_img).copy()
+        return dst_img
     img_crop_width = int(
         max(
             np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])
@@ -76,6 +115,57 @@ def get_minarea_rect_crop(img, points):
     return crop_img
 
 
+# 页面旋转角度（顺时针）到 cv2.rotate 参数的映射
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def rotate_image(img, angle):
+    """
+    rotate img clockwise by angle (one of 0/90/180/270)
+    """
+    if angle % 360 == 0:
+        return img
+    return cv2.rotate(img, ROTATE_CODES[angle % 360])
+
+
+def rotate_boxes(boxes, angle, img_shape, roll=True):
+    """
+    map boxes(N, 4, 2) of an image with shape img_shape into the image rotated
+    clockwise by angle. The point order is rolled so that every box still
+    starts from its top-left corner in the rotated frame; with roll=False
+    every point keeps its index (the box keeps its reading direction).
+    """
+    angle = angle % 360
+    boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    if angle == 0:
+        return boxes
+    h, w = img_shape[0:2]
+    x = boxes[:, :, 0]
+    y = boxes[:, :, 1]
+    if angle == 90:
+        rotated = np.stack([h - 1 - y, x], axis=-1)
+    elif angle == 180:
+        rotated = np.stack([w - 1 - x, h - 1 - y], axis=-1)
+    else:
+        rotated = np.stack([y, w - 1 - x], axis=-1)
+    return np.roll(rotated, angle // 90, axis=1) if roll else rotated
+
+
+def unrotate_boxes(boxes, angle, rotated_shape, roll=True):
+    """
+    inverse of rotate_boxes: map boxes of the rotated image back to the
+    original image. rotated_shape is the shape of the rotated image.
+    """
+    angle = angle % 360
+    if angle == 0:
+        return np.array(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    return rotate_boxes(boxes, 360 - angle, rotated_shape, roll)
+
+
 def resize_img(img, input_size=600):
     """
     resize img and limit the longest side of the image to input_size
@@ -113,6 +203,19 @@ def str_count(s):
     return s_len - math.ceil(en_dg_count / 2)
 
 
+@lru_cache(maxsize=8)
+def load_font(font_path, font_size):
+    """字体文件只加载一次，画图时复用"""
+    return ImageFont.truetype(font_path, font_size, encoding="utf-8")
+
+
+@lru_cache(maxsize=16)
+def _blank_canvas(img_h, img_w):
+    blank_img = np.ones(shape=[img_h, img_w], dtype=np.int8) * 255
+    blank_img[:, img_w - 1 :] = 0
+    return Image.fromarray(blank_img).convert("RGB")
+
+
 def text_visual(
     texts,
     scores,
@@ -137,9 +240,8 @@ def text_visual(
         ), "The number of txts and corresponding scores must match"
 
     def create_blank_img():
-        blank_img = np.ones(shape=[img_h, img_w], dtype=np.int8) * 255
-        blank_img[:, img_w - 1 :] = 0
-        blank_img = Image.fromarray(blank_img).convert("RGB")
+        # 同尺寸的空白画布只生成一次，之后复制
+        blank_img = _blank_canvas(img_h, img_w).copy()
         draw_txt = ImageDraw.Draw(blank_img)
         return blank_img, draw_txt
 
@@ -147,7 +249,7 @@ def text_visual(
 
     font_size = 20
     txt_color = (0, 0, 0)
-    font = ImageFont.truetype(font_path, font_size, encoding="utf-8")
+    font = load_font(font_path, font_size)
 
     gap = font_size + 5
     txt_img_list = []
@@ -215,11 +317,13 @@ def draw_ocr(
     if scores is None:
         scores = [1] * len(boxes)
     box_num = len(boxes)
+    # 复制一次后在同一张图上画所有框
+    image = np.array(image)
     for i in range(box_num):
         if scores is not None and (scores[i] < drop_score or math.isnan(scores[i])):
             continue
         box = np.reshape(np.array(boxes[i]), [-1, 1, 2]).astype(np.int64)
-        image = cv2.polylines(np.array(image), [box], True, (255, 0, 0), 2)
+        cv2.polylines(image, [box], True, (255, 0, 0), 2)
     if txts is not None:
         img = np.array(resize_img(image, input_size=600))
         txt_img = text_visual(
@@ -235,6 +339,31 @@ def draw_ocr(
     return image
 
 
+# 模型精度版本：fp32 为原始模型，其余由 quantize_models.py 生成
+QUANT_VARIANTS = ("fp32", "int8_dynamic", "int8_static")
+
+
+def quantized_model_path(model_path, variant):
+    """
+    models/ppocrv5/rec/rec.onnx + int8_dynamic -> models/ppocrv5/rec/rec_int8_dynamic.onnx
+    """
+    if variant in (None, "", "fp32"):
+        return model_path
+    assert variant in QUANT_VARIANTS, "quant variant must be one of {}, got {}".format(
+        QUANT_VARIANTS, variant
+    )
+    root, ext = os.path.splitext(model_path)
+    return "{}_{}{}".format(root, variant, ext)
+
+
+def shared_model_path(model_path):
+    """
+    models/ppocrv5/rec/rec.onnx -> models/ppocrv5/rec/rec_shared.onnx（由 shared_weights.py 生成）
+    """
+    root, ext = os.path.splitext(model_path)
+    return "{}_shared{}".format(root, ext)
+
+
 def base64_to_cv2(b64str):
     import base64
 
@@ -272,6 +401,8 @@ def infer_args():
     )
     parser.add_argument("--det_limit_side_len", type=float, default=960)
     parser.add_argument("--det_limit_type", type=str, default="max")
+    # 按文件读取时缩小解码：检测限制边至少保留 det_limit_side_len 的倍数（留给裁剪识别），0 表示不缩小
+    parser.add_argument("--decode_crop_scale", type=float, default=2.0)
     parser.add_argument("--det_box_type", type=str, default="quad")
 
     # DB parmas
@@ -282,6 +413,17 @@ def infer_args():
     parser.add_argument("--use_dilation", type=str2bool, default=False)
     parser.add_argument("--det_db_score_mode", type=str, default="fast")
 
+    # pre-recognition box filters, 0 disables a filter
+    parser.add_argument("--det_min_score", type=float, default=0.0)
+    parser.add_argument("--det_min_height", type=float, default=0)
+    parser.add_argument("--det_max_aspect_ratio", type=float, default=0.0)
+    parser.add_argument("--crop_min_std", type=float, default=0.0)
+    parser.add_argument("--crop_min_ink", type=float, default=0.0)
+
+    # reading order
+    parser.add_argument("--line_y_tol", type=float, default=0.5)
+    parser.add_argument("--use_column_order", type=str2bool, default=False)
+
     # EAST parmas
     parser.add_argument("--det_east_score_thresh", type=float, default=0.8)
     parser.add_argument("--det_east_cover_thresh", type=float, default=0.1)
@@ -323,7 +465,28 @@ def infer_args():
     parser.add_argument(
         "--vis_font_path", type=str, default=str(module_dir / "fonts/simfang.ttf")
     )
+    parser.add_argument("--rec_return_char_info", type=str2bool, default=False)
+    # 识别结果缓存：固定文字（证件标题、字段标签）跨调用复用识别结果，0 表示关闭
+    parser.add_argument("--rec_cache_size", type=int, default=0)
+    # 只缓存、只返回置信度不低于该值的结果
+    parser.add_argument("--rec_cache_min_score", type=float, default=0.95)
+    # 缩略图逐块校验的差异阈值，越小越严格
+    parser.add_argument("--rec_cache_tol", type=float, default=0.2)
+    # 两级识别的第二级（大模型）路径，为空时不启用；第一级为 rec_model_dir（可配合 rec_quant）
+    parser.add_argument("--rec_cascade_model_dir", type=str, default=None)
+    # 第一级置信度低于该值的行送入第二级
+    parser.add_argument("--rec_cascade_thresh", type=float, default=0.9)
     parser.add_argument("--drop_score", type=float, default=0.5)
+    # 低置信度的行带余量重新裁剪（调用方提供高分辨率原图时从原图裁剪），额外识别一批，保留置信度更高的结果
+    parser.add_argument("--use_refine", type=str2bool, default=False)
+    # 置信度低于该值的行参与二次识别，通常不低于 drop_score
+    parser.add_argument("--refine_thresh", type=float, default=0.5)
+    # 裁剪余量，占行高的比例
+    parser.add_argument("--refine_pad", type=float, default=0.15)
+    # 二次识别前按灰度分位数拉伸对比度
+    parser.add_argument("--refine_contrast", type=str2bool, default=True)
+    # 每页最多二次识别的行数，0 表示不限
+    parser.add_argument("--refine_max_lines", type=int, default=12)
 
     # params for e2e
     parser.add_argument("--e2e_algorithm", type=str, default="PGNet")
@@ -352,9 +515,56 @@ def infer_args():
     parser.add_argument("--label_list", type=list, default=["0", "180"])
     parser.add_argument("--cls_batch_num", type=int, default=6)
     parser.add_argument("--cls_thresh", type=float, default=0.9)
+    parser.add_argument("--cls_use_thumbnail", type=str2bool, default=False)
+    parser.add_argument("--use_lazy_cls", type=str2bool, default=False)
+    parser.add_argument("--lazy_cls_thresh", type=float, default=0.85)
+
+    # params for page orientation
+    parser.add_argument("--use_page_orientation", type=str2bool, default=False)
+    parser.add_argument("--page_ori_sample_num", type=int, default=6)
+    parser.add_argument("--page_ori_thresh", type=float, default=0.8)
+
+    # params for page deskew
+    parser.add_argument("--use_deskew", type=str2bool, default=False)
+    # 倾斜角小于该值（度）时不校正
+    parser.add_argument("--deskew_min_angle", type=float, default=0.3)
+    # 倾斜角大于该值时视为版面本身的斜排文字，不校正
+    parser.add_argument("--deskew_max_angle", type=float, default=15.0)
+
+    # params for triage / quality gate
+    # 曝光、反光统计用的缩略图长边
+    parser.add_argument("--triage_side", type=int, default=512)
+    # 分诊检测的长边限制
+    parser.add_argument("--triage_det_side", type=int, default=640)
+    # 拉普拉斯方差下限，低于该值视为模糊
+    parser.add_argument("--triage_min_sharpness", type=float, default=40.0)
+    # 99% 分位灰度下限，低于该值视为过暗
+    parser.add_argument("--triage_min_white", type=float, default=60.0)
+    # 1% 分位灰度上限，高于该值视为过曝
+    parser.add_argument("--triage_max_black", type=float, default=200.0)
+    parser.add_argument("--triage_min_contrast", type=float, default=40.0)
+    # 反光区域占比上限
+    parser.add_argument("--triage_max_glare", type=float, default=0.05)
+    # 文字面积占比下限
+    parser.add_argument("--triage_min_text_area", type=float, default=0.01)
+    parser.add_argument("--triage_min_boxes", type=int, default=3)
 
     parser.add_argument("--enable_mkldnn", type=str2bool, default=False)
     parser.add_argument("--cpu_threads", type=int, default=10)
+    # onnxruntime 单个会话的 intra-op 线程数，0 表示由 onnxruntime 决定（通常为物理核数）
+    parser.add_argument("--intra_op_num_threads", type=int, default=0)
+    # 每个模型的会话数，大于 1 时并发调用各自使用独立会话并行执行
+    parser.add_argument("--session_pool_size", type=int, default=1)
+    # 允许 onnxruntime 线程池空闲时自旋等待（降低延迟，但会占用 CPU）
+    parser.add_argument("--ort_allow_spinning", type=str2bool, default=True)
+    # CPU 预算：核数（-1 表示全部核，0 表示不管理），在并发调用、OpenCV 和 onnxruntime 之间分配
+    parser.add_argument("--cpu_budget", type=int, default=0)
+    # 预期的并发调用数，0 表示取 session_pool_size
+    parser.add_argument("--cpu_workers", type=int, default=0)
+    # 加载 shared_weights.py 生成的共享权重模型，权重内存映射，多进程共用一份物理内存
+    parser.add_argument("--shared_weights", type=str2bool, default=False)
+    # 共享权重时仍为每个会话预打包 MatMul 权重：更快，但每个会话多一份私有副本
+    parser.add_argument("--shared_weights_prepack", type=str2bool, default=False)
     parser.add_argument("--use_pdserving", type=str2bool, default=False)
     parser.add_argument("--warmup", type=str2bool, default=False)
 
@@ -384,4 +594,9 @@ def infer_args():
 
     parser.add_argument("--show_log", type=str2bool, default=True)
     parser.add_argument("--use_onnx", type=str2bool, default=False)
+
+    # quantized model variants per stage: fp32 / int8_dynamic / int8_static
+    parser.add_argument("--det_quant", type=str, default="fp32")
+    parser.add_argument("--cls_quant", type=str, default="fp32")
+    parser.add_argument("--rec_quant", type=str, default="fp32")
     return parser
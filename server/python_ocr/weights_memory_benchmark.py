@@ -0,0 +1,87 @@
+"""
+对比独立加载与共享权重加载时各工作进程的内存占用
+
+    python shared_weights.py --model_dir models/ppocrv5
+    python weights_memory_benchmark.py --workers 4 --image ./test.jpg
+
+每种模式启动 workers 个进程，各自加载模型并识别一次，全部进程同时驻留时读取内存：
+rss 常驻内存、anon 私有内存（每个进程各一份）、file 文件映射（共享权重在此，
+多个进程共用页缓存）为加载模型前后的增量，pss 为按共享进程数均摊后的实际占用。
+"""
+import argparse
+import multiprocessing
+import os
+
+import cv2
+import numpy as np
+
+from shared_weights import memory_usage
+
+MODES = {
+    "private": dict(shared_weights=False),
+    "shared": dict(shared_weights=True),
+    "shared+prepack": dict(shared_weights=True, shared_weights_prepack=True),
+}
+
+
+def worker(model_kwargs, image_path, loaded, measure, results):
+    from onnx_paddleocr import ONNXPaddleOcr
+
+    base = memory_usage()
+    model = ONNXPaddleOcr(use_gpu=False, **model_kwargs)
+    img = cv2.imread(image_path) if image_path else None
+    if img is None:
+        img = np.full((640, 480, 3), 255, dtype=np.uint8)
+        cv2.putText(img, "shared weights", (20, 320), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    model.ocr(img)
+    # 等所有进程都加载完再测，PSS 才能反映共享
+    loaded.wait()
+    usage = memory_usage()
+    results.put({k: v - base.get(k, 0.0) if k != "pss" else v for k, v in usage.items()})
+    measure.wait()
+
+
+def run_mode(model_kwargs, workers, image_path):
+    ctx = multiprocessing.get_context("spawn")
+    loaded, measure = ctx.Barrier(workers), ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(model_kwargs, image_path, loaded, measure, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--model_dir", type=str, default=None, help="含 det/cls/rec 子目录的模型目录，默认内置模型")
+    parser.add_argument("--image", type=str, default=None)
+    parser.add_argument("--modes", type=str, default=",".join(MODES))
+    parser.add_argument("--intra_op_num_threads", type=int, default=1)
+    args = parser.parse_args()
+
+    print("{:<16}{:>8}{:>10}{:>10}{:>10}{:>10}".format("mode", "worker", "rss MB", "anon MB", "file MB", "pss MB"))
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        model_kwargs = dict(MODES[mode], intra_op_num_threads=args.intra_op_num_threads)
+        if args.model_dir:
+            for stage in ("det", "cls", "rec"):
+                model_kwargs[stage + "_model_dir"] = os.path.join(args.model_dir, stage, stage + ".onnx")
+        rows = run_mode(model_kwargs, args.workers, args.image)
+        for i, row in enumerate(rows):
+            print(
+                "{:<16}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+                    mode, i, row.get("rss", 0), row.get("anon", 0), row.get("file", 0), row.get("pss", 0)
+                )
+            )
+        total_pss = sum(row.get("pss", 0) for row in rows)
+        print("{:<16}{:>8}{:>50.1f}".format(mode, "total", total_pss))
+
+
+if __name__ == "__main__":
+    main()
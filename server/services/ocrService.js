@@ -126,6 +126,8 @@ class OCRService {
       return {
         success: true,
         extractedText: results.extracted_text,
+        lines: results.lines || [],
+        paragraphs: results.paragraphs || [],
         method: 'PPOCRv5 Standalone Python Service',
         results: results.results.map(item => [
           item.box,